@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import environ
+from corsheaders.defaults import default_headers
 import os
 
 env = environ.Env(
@@ -59,9 +60,21 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'shop.middleware.PricingContextMiddleware',
 ]
 
+# Opt-in per-request query and timing instrumentation, see shop.middleware.RequestMetricsMiddleware
+REQUEST_METRICS = env.bool('REQUEST_METRICS', default=False)
+SLOW_REQUEST_MS = env.int('SLOW_REQUEST_MS', default=500)
+SLOW_REQUEST_QUERIES = env.int('SLOW_REQUEST_QUERIES', default=50)
+DUPLICATE_QUERY_THRESHOLD = env.int('DUPLICATE_QUERY_THRESHOLD', default=5)
+
+if REQUEST_METRICS:
+    MIDDLEWARE.insert(0, 'shop.middleware.RequestMetricsMiddleware')
+
 CORS_ALLOW_ALL_ORIGINS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
+CORS_EXPOSE_HEADERS = ['Idempotent-Replayed']
 
 ROOT_URLCONF = 'baco_backend.urls'
 
@@ -82,17 +95,76 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'baco_backend.wsgi.application'
 
+# Route the read-only endpoints to the async views of shop.async_views, enabled by default under ASGI
+ASYNC_READ_VIEWS = env.bool('ASYNC_READ_VIEWS', default=False)
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+    'default': env.db('DATABASE_URL', default=f'sqlite:///{BASE_DIR / "db.sqlite3"}'),
+}
+
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    # WAL lets the tablets read while an order is written. IMMEDIATE transactions take the
+    # write lock up front, so concurrent writers wait up to the busy timeout instead of
+    # failing with "database is locked" when upgrading a read lock
+    DATABASES['default']['OPTIONS'] = {
+        'init_command': (
+            'PRAGMA journal_mode=WAL;'
+            'PRAGMA synchronous=NORMAL;'
+            f"PRAGMA mmap_size={env.int('SQLITE_MMAP_SIZE', default=256 * 1024 * 1024)};"
+        ),
+        'timeout': env.int('SQLITE_BUSY_TIMEOUT', default=20),
+        'transaction_mode': 'IMMEDIATE',
+        **DATABASES['default'].get('OPTIONS', {}),
     }
+    # An in-memory database cannot be shared between threads or use WAL
+    DATABASES['default']['TEST'] = {'NAME': BASE_DIR / 'test_db.sqlite3'}
+else:
+    # PostgreSQL (needs psycopg): keep connections open between requests, checked before reuse.
+    # Server-side cursors stream .iterator() querysets, turn them off behind a transaction pooler
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': env.int('CONN_MAX_AGE', default=60),
+        'CONN_HEALTH_CHECKS': True,
+        'DISABLE_SERVER_SIDE_CURSORS': env.bool('DISABLE_SERVER_SIDE_CURSORS', default=False),
+    })
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
 }
 
+# Upper bound on how stale the product ordering by sales may get, catalogue edits invalidate immediately
+CATALOGUE_CACHE_TIMEOUT = env.int('CATALOGUE_CACHE_TIMEOUT', default=300)
+
+# The analytics dashboard is cached as a whole for this many seconds
+DASHBOARD_CACHE_TIMEOUT = env.int('DASHBOARD_CACHE_TIMEOUT', default=60)
+
+
+# Seconds an API token and its user are cached, see shop.authentication
+TOKEN_CACHE_TIMEOUT = env.int('TOKEN_CACHE_TIMEOUT', default=60)
+
+
+# Seconds an Idempotency-Key of an order or payment is remembered, see shop.idempotency
+IDEMPOTENCY_KEY_TTL = env.int('IDEMPOTENCY_KEY_TTL', default=24 * 60 * 60)
+
+
+# Seconds deletions are remembered for /api/sync/, older sync tokens get a full snapshot
+SYNC_TOMBSTONE_TTL = env.int('SYNC_TOMBSTONE_TTL', default=30 * 24 * 60 * 60)
+
+
+# Server-sent events, see shop.events. The in-process bus only reaches clients of the same worker
+EVENT_BUS_BACKEND = env('EVENT_BUS_BACKEND', default='shop.events.InProcessBus')
+
+
+# Background jobs, see shop.tasks. Eager mode runs tasks inline instead of through the run_jobs worker
+TASKS_EAGER = env.bool('TASKS_EAGER', default=False)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -144,9 +216,25 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'shop.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
 }
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'shop.requests': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+        },
+    },
+}
@@ -1,13 +1,21 @@
 from django.contrib import admin, messages
 from django.shortcuts import redirect
 from django.urls import path
-from shop.models import Category, Order, OrderItem, Payment, Product, Settings, Team, TeamMember
+from django.core.files.storage import default_storage
+from shop import ledger
+from shop.models import BalanceEntry, Category, ClosedDay, Job, Order, OrderItem, Payment, Product, Settings, Team, TeamMember
+from shop.pricing import get_margin
 from django.utils.html import format_html
+from django.utils.timezone import now
 from django.utils.safestring import mark_safe
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-  list_display = ("__str__", "total_amount")
+  list_display = ("__str__", "by", "total_amount")
+  list_filter = ("by__team",)
+  list_select_related = ("by",)
+  date_hierarchy = "datetime"
+  search_fields = ("by__name",)
   readonly_fields = ("total_amount", "datetime")
 
   def has_add_permission(self, request, obj=None):
@@ -17,6 +25,9 @@ class OrderAdmin(admin.ModelAdmin):
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
   list_display = ("__str__", "order")
+  list_filter = ("product__category",)
+  list_select_related = ("product", "order__by")
+  date_hierarchy = "order__datetime"
 
   def has_add_permission(self, request, obj=None):
     return False
@@ -25,6 +36,10 @@ class OrderItemAdmin(admin.ModelAdmin):
 @admin.register(TeamMember)
 class TeamMemberAdmin(admin.ModelAdmin):
   list_display = ("name", "team", "display_balance", "balance")
+  list_filter = ("team",)
+  list_select_related = ("team",)
+  search_fields = ("name",)
+  readonly_fields = ("balance",) # Changed through balance entries only
 
   def display_balance(self, obj):
     return obj.balance - 15
@@ -34,11 +49,28 @@ class TeamMemberAdmin(admin.ModelAdmin):
 class PaymentAdmin(admin.ModelAdmin):
   change_form_template = "admin/payment_changeform.html"
 
+  list_display = ("__str__", "by", "amount", "completed")
+  list_filter = ("completed",)
+  list_select_related = ("by",)
+  search_fields = ("by__name",)
+  actions = ["complete_payments"]
+
+  @admin.action(description="Complete selected payments")
+  def complete_payments(self, request, queryset):
+    selected = list(queryset.values_list("pk", flat=True))
+    completed = ledger.complete_payments(selected)
+    skipped = len(selected) - len(completed)
+    self.message_user(request, f"{len(completed)} payment(s) completed and balances updated.", messages.SUCCESS)
+    if skipped:
+      self.message_user(request, f"{skipped} payment(s) were already completed.", messages.WARNING)
+
   readonly_fields = ("proof_preview",)
 
   def proof_preview(self, obj):
     if obj.proof_picture:
-      return format_html('<img src="{}" style="max-height: 200px;"/>', obj.proof_picture.url)
+      thumb = obj.proof_variants.get("thumb", {}).get("jpg")
+      url = default_storage.url(thumb) if thumb else obj.proof_picture.url
+      return format_html('<a href="{}"><img src="{}" style="max-height: 200px;"/></a>', obj.proof_picture.url, url)
     return "No image uploaded"
   
   proof_preview.short_description = "Proof Preview"
@@ -55,23 +87,58 @@ class PaymentAdmin(admin.ModelAdmin):
     return custom_urls + urls
 
   def process_complete(self, request, pk, *args, **kwargs):
-    payment = Payment.objects.get(pk=pk)
-    if not payment.completed:
-      payment.by.balance += payment.amount
-      payment.by.save()
-      payment.completed = True
-      payment.save()
+    if ledger.complete_payments([pk]):
       self.message_user(request, "Payment completed and balance updated!", messages.SUCCESS)
     else:
       self.message_user(request, "Payment already completed.", messages.WARNING)
     return redirect(f"../../{pk}/change/")
 
 
+@admin.register(BalanceEntry)
+class BalanceEntryAdmin(admin.ModelAdmin):
+  list_display = ("datetime", "member", "kind", "amount", "description")
+  list_filter = ("kind",)
+  list_select_related = ("member",)
+  fields = ("member", "amount", "description")
+
+  def has_change_permission(self, request, obj=None):
+    return False # The ledger is append-only
+
+  def has_delete_permission(self, request, obj=None):
+    return False
+
+  def save_model(self, request, obj, form, change):
+    obj.kind = BalanceEntry.ADJUSTMENT
+    obj.pk = ledger.record(obj.member_id, obj.amount, obj.kind, description=obj.description).pk
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+  list_display = ("__str__", "name", "status", "attempts", "run_at", "finished")
+  list_filter = ("status", "name")
+  readonly_fields = ("name", "payload", "idempotency_key", "status", "attempts", "max_attempts", "run_at", "created", "started", "finished", "last_error")
+  actions = ["retry_jobs"]
+
+  def has_add_permission(self, request):
+    return False
+
+  @admin.action(description="Retry selected jobs")
+  def retry_jobs(self, request, queryset):
+    retried = queryset.exclude(status=Job.RUNNING).update(status=Job.PENDING, attempts=0, run_at=now())
+    self.message_user(request, f"{retried} job(s) queued again.", messages.SUCCESS)
+
+
 @admin.register(Team)
 class TeamAdmin(admin.ModelAdmin):
   list_display = ("__str__", "start_date")
 
 
+@admin.register(ClosedDay)
+class ClosedDayAdmin(admin.ModelAdmin):
+  list_display = ("date", "reason")
+  date_hierarchy = "date"
+
+
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
   list_display = (
@@ -83,6 +150,7 @@ class ProductAdmin(admin.ModelAdmin):
   )
   list_filter = ("visible", "category")
   search_fields = ("name",)
+  list_select_related = ("category",)
 
   readonly_fields = ("unit_cost_preview", "price_preview")
 
@@ -102,15 +170,15 @@ class ProductAdmin(admin.ModelAdmin):
   )
 
   def unit_cost_preview(self, obj):
-    return f"€{obj.calculate_unit_cost():.2f}" if obj.id else "-"
+    return f"€{obj.unit_cost:.2f}" if obj.id else "-"
   unit_cost_preview.short_description = "Unit Cost (incl. BTW)"
 
   def price_display(self, obj):
-    return f"€{obj.price:.2f}"
+    return f"€{obj.sale_price:.2f}"
   price_display.short_description = "Sale Price"
 
   def price_preview(self, obj):
-    margin = Settings.objects.first().margin_percentage
+    margin = get_margin()
     return mark_safe(
       f"<div id='price-preview' data-margin='{1 + (margin / 100)}' style='font-weight:600;'>—</div>"
       "<p style='color:#666;'>Live price preview</p>"
@@ -0,0 +1,188 @@
+"""Dashboard figures, read from the DailySales and DailyOrderTotals rollups only.
+
+Every figure is split into a lazy queryset and a function shaping its rows, so the
+synchronous viewset and the async views evaluate the exact same queries.
+"""
+import asyncio
+from datetime import timedelta
+from django.db.models import Sum
+from django.utils.timezone import localdate
+from . import business_days
+from .models import DailyOrderTotals, DailySales
+
+
+def chart(rows, label, value):
+  return {"labels": [row[label] for row in rows], "values": [row[value] for row in rows]}
+
+
+def top_products_query():
+  return (
+    DailySales.objects
+    .values("product__name")
+    .annotate(total_sold=Sum("quantity"))
+    .order_by("-total_sold")[:5]
+  )
+
+
+def top_products_result(rows):
+  return chart(rows, "product__name", "total_sold")
+
+
+def top_users_query():
+  return (
+    DailyOrderTotals.objects
+    .values("member__name")
+    .annotate(total_spent=Sum("total_amount"))
+    .order_by("-total_spent")[:5]
+  )
+
+
+def top_users_result(rows):
+  return chart(rows, "member__name", "total_spent")
+
+
+def summary_query(user_id=None):
+  totals = DailyOrderTotals.objects.all()
+  if user_id:
+    totals = totals.filter(member_id=user_id)
+  return totals
+
+
+SUMMARY_AGGREGATES = {"total": Sum("total_amount"), "orders": Sum("order_count")}
+
+
+def summary_result(aggregates, calendar):
+  total_spent = aggregates["total"] or 0
+  total_orders = aggregates["orders"] or 0
+
+  avg_order_value = round(total_spent / total_orders, 2) if total_orders > 0 else 0.00
+
+  open_days = calendar.open_days(localdate())
+  if total_orders > 0 and open_days > 0:
+    avg_orders_per_day = round(total_orders / open_days, 1)
+  else:
+    avg_orders_per_day = 0.0
+
+  return {
+    "total_spent": total_spent,
+    "total_orders": total_orders,
+    "avg_order_value": avg_order_value,
+    "avg_orders_per_day": avg_orders_per_day,
+  }
+
+
+def sales_over_time_range(days=30):
+  end_date = localdate()
+  return end_date - timedelta(days=days), end_date
+
+
+def sales_over_time_query(start_date):
+  return (
+    DailySales.objects
+    .filter(date__gte=start_date)
+    .values("date")
+    .annotate(total=Sum("quantity"))
+    .order_by()
+  )
+
+
+def sales_over_time_result(rows, start_date, end_date, calendar):
+  """Units sold per open day; weekends and closed days are left out unless something was sold."""
+  totals_by_date = {item["date"]: float(item["total"]) for item in rows}
+  dates = sorted(set(calendar.open_dates(start_date, end_date)) | set(totals_by_date))
+
+  return {
+    "labels": [day.strftime("%d-%m") for day in dates],
+    "values": [totals_by_date.get(day, 0.0) for day in dates],
+  }
+
+
+def member_totals_query():
+  return (
+    DailyOrderTotals.objects
+    .values("member", "member__name")
+    .annotate(total_spent=Sum("total_amount"), orders=Sum("order_count"))
+    .order_by("-total_spent")
+  )
+
+
+def dashboard_result(member_rows, product_rows, sales_rows, user_id, start_date, end_date, calendar):
+  """Every dashboard widget, with top users and the summary derived from the same member totals."""
+  selected = [row for row in member_rows if str(row["member"]) == str(user_id)] if user_id else member_rows
+  return {
+    "top_products": top_products_result(product_rows),
+    "top_users": top_users_result(member_rows[:5]),
+    "summary": summary_result({
+      "total": sum(row["total_spent"] for row in selected),
+      "orders": sum(row["orders"] for row in selected),
+    }, calendar),
+    "sales_over_time": sales_over_time_result(sales_rows, start_date, end_date, calendar),
+  }
+
+
+def top_products():
+  return top_products_result(list(top_products_query()))
+
+
+async def atop_products():
+  return top_products_result([row async for row in top_products_query()])
+
+
+def top_users():
+  return top_users_result(list(top_users_query()))
+
+
+async def atop_users():
+  return top_users_result([row async for row in top_users_query()])
+
+
+def summary(user_id=None):
+  return summary_result(summary_query(user_id).aggregate(**SUMMARY_AGGREGATES), business_days.calendar())
+
+
+async def asummary(user_id=None):
+  aggregates, calendar = await asyncio.gather(
+    summary_query(user_id).aaggregate(**SUMMARY_AGGREGATES), business_days.acalendar(),
+  )
+  return summary_result(aggregates, calendar)
+
+
+def sales_over_time(days=30):
+  start_date, end_date = sales_over_time_range(days)
+  rows = list(sales_over_time_query(start_date))
+  return sales_over_time_result(rows, start_date, end_date, business_days.calendar())
+
+
+async def asales_over_time(days=30):
+  start_date, end_date = sales_over_time_range(days)
+
+  async def rows():
+    return [row async for row in sales_over_time_query(start_date)]
+
+  sales_rows, calendar = await asyncio.gather(rows(), business_days.acalendar())
+  return sales_over_time_result(sales_rows, start_date, end_date, calendar)
+
+
+def dashboard_cache_key(user_id, days):
+  return f"analytics:dashboard:{user_id or ''}:{days}"
+
+
+def dashboard(user_id=None, days=30):
+  start_date, end_date = sales_over_time_range(days)
+  return dashboard_result(
+    list(member_totals_query()), list(top_products_query()), list(sales_over_time_query(start_date)),
+    user_id, start_date, end_date, business_days.calendar(),
+  )
+
+
+async def adashboard(user_id=None, days=30):
+  start_date, end_date = sales_over_time_range(days)
+
+  async def rows(queryset):
+    return [row async for row in queryset]
+
+  member_rows, product_rows, sales_rows, calendar = await asyncio.gather(
+    rows(member_totals_query()), rows(top_products_query()), rows(sales_over_time_query(start_date)),
+    business_days.acalendar(),
+  )
+  return dashboard_result(member_rows, product_rows, sales_rows, user_id, start_date, end_date, calendar)
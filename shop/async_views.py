@@ -0,0 +1,138 @@
+"""Async versions of the read-only endpoints, routed instead of the viewsets under ASGI.
+
+DRF views are synchronous, so these are plain Django async views that use the async
+ORM and reuse the serializers, catalogue cache and analytics queries of the sync API.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework.exceptions import AuthenticationFailed, NotAuthenticated
+from rest_framework.renderers import JSONRenderer
+from . import analytics, events, representations
+from .authentication import KEYWORD, acached_token, token_key, token_user
+from .cache import CatalogueResponse, acatalogue_version
+from .models import Product
+from .serializers import CategorySerializer, ProductSerializer, TeamSerializer
+
+
+async def authenticate(request, allow_query_token=False):
+  """Authenticate like CachedTokenAuthentication does, returning ``(user, error)``.
+
+  With ``allow_query_token`` the token may also be given as ``?token=``, for clients such
+  as EventSource that cannot set headers.
+  """
+  header = request.headers.get("Authorization", "")
+  if not header and allow_query_token and request.GET.get("token"):
+    header = f"{KEYWORD} {request.GET['token']}"
+  try:
+    key = token_key(header)
+    if key is None:
+      return None, NotAuthenticated.default_detail
+    return token_user(await acached_token(key)), None
+  except AuthenticationFailed as error:
+    return None, error.detail
+
+
+def render(data, status=200):
+  return HttpResponse(JSONRenderer().render(data), status=status, content_type="application/json")
+
+
+class AsyncReadView(View):
+  """Token authenticated GET, handled by the ``aget`` method of each concrete view."""
+  http_method_names = ["get", "options"]
+  allow_query_token = False
+
+  async def get(self, request, *args, **kwargs):
+    request.user, error = await authenticate(request, self.allow_query_token)
+    if error:
+      response = render({"detail": error}, status=401)
+      response["WWW-Authenticate"] = KEYWORD
+      return response
+    return await self.aget(request, *args, **kwargs)
+
+
+class CatalogueView(AsyncReadView):
+  """List or detail of a catalogue model, cached exactly like CachedResponseMixin does."""
+  serializer_class = None
+
+  def get_queryset(self, request):
+    return self.serializer_class.Meta.model.objects.all()
+
+  async def represent_list(self, queryset, request):
+    return self.serializer_class([obj async for obj in queryset], many=True, context={"request": request}).data
+
+  async def aget(self, request, pk=None):
+    cached = CatalogueResponse(request, await acatalogue_version())
+    cached.entry = await cache.aget(cached.key)
+    if cached.entry is None:
+      queryset = self.get_queryset(request)
+      if pk is None:
+        data = await self.represent_list(queryset, request)
+      else:
+        obj = await queryset.filter(pk=pk).afirst()
+        if obj is None:
+          return render({"detail": f"No {queryset.model._meta.object_name} matches the given query."}, status=404)
+        data = self.serializer_class(obj, context={"request": request}).data
+      await cache.aset(cached.key, cached.build(data), settings.CATALOGUE_CACHE_TIMEOUT)
+
+    if cached.is_not_modified(request):
+      return cached.add_headers(HttpResponse(status=304))
+    return cached.add_headers(render(cached.entry["data"]))
+
+
+class TeamView(CatalogueView):
+  serializer_class = TeamSerializer
+
+
+class CategoryView(CatalogueView):
+  serializer_class = CategorySerializer
+
+
+class ProductView(CatalogueView):
+  serializer_class = ProductSerializer
+
+  def get_queryset(self, request):
+    queryset = Product.objects.select_related("category").order_by("-total_ordered", "id")
+
+    category_id = request.GET.get('category')
+    if category_id is not None:
+      queryset = queryset.filter(category_id=category_id)
+    return queryset
+
+  async def represent_list(self, queryset, request):
+    return representations.products([row async for row in queryset.values(*representations.PRODUCT_VALUES)], request)
+
+
+class AnalyticsView(AsyncReadView):
+  async def aget(self, request, action):
+    if action == "top-products":
+      data = await analytics.atop_products()
+    elif action == "top-users":
+      data = await analytics.atop_users()
+    elif action == "summary":
+      data = await analytics.asummary(request.GET.get("user_id"))
+    elif action == "dashboard":
+      data = await self.dashboard(request.GET.get("user_id"), int(request.GET.get("days", 30)))
+    else:
+      data = await analytics.asales_over_time(int(request.GET.get("days", 30)))
+    return render(data)
+
+  async def dashboard(self, user_id, days):
+    key = analytics.dashboard_cache_key(user_id, days)
+    data = await cache.aget(key)
+    if data is None:
+      data = await analytics.adashboard(user_id, days)
+      await cache.aset(key, data, settings.DASHBOARD_CACHE_TIMEOUT)
+    return data
+
+
+class EventStreamView(AsyncReadView):
+  """Server-sent events of shop.events, only routed under ASGI where an idle client costs no thread."""
+  allow_query_token = True
+
+  async def aget(self, request):
+    response = StreamingHttpResponse(events.stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,96 @@
+"""Token authentication that keeps the token and its user in the cache for a short while.
+
+DRF's TokenAuthentication reads the token and its user on every request. Tablets poll
+the API every few seconds, so the lookup is cached for ``TOKEN_CACHE_TIMEOUT`` seconds.
+Deleting a token, or saving its user with a changed password, active or staff flag,
+evicts the entry, see shop.signals. Queryset ``update()`` calls send no signals, so
+code that deactivates users in bulk must call ``evict_user_tokens`` itself.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+KEYWORD = "Token"
+INVALID_TOKEN = "Invalid token."
+INACTIVE_USER = "User inactive or deleted."
+# User fields whose change has to reach the cached tokens right away
+AUTH_FIELDS = ("password", "is_active", "is_staff", "is_superuser")
+
+
+def token_cache_key(key):
+  return f"auth-token:{key}"
+
+
+def token_query():
+  # The password hash is left out so it never ends up in a shared cache
+  return Token.objects.select_related("user").defer("user__password")
+
+
+def cached_token(key):
+  """Token ``key`` with its user, or None when there is no such token."""
+  cache_key = token_cache_key(key)
+  token = cache.get(cache_key)
+  if token is None:
+    token = token_query().filter(key=key).first()
+    if token is None:
+      return None
+    cache.set(cache_key, token, settings.TOKEN_CACHE_TIMEOUT)
+  return token
+
+
+async def acached_token(key):
+  cache_key = token_cache_key(key)
+  token = await cache.aget(cache_key)
+  if token is None:
+    token = await token_query().filter(key=key).afirst()
+    if token is None:
+      return None
+    await cache.aset(cache_key, token, settings.TOKEN_CACHE_TIMEOUT)
+  return token
+
+
+def evict_user_tokens(*users):
+  """Drop the cached tokens of ``users``, e.g. after ``User.objects.filter(...).update(is_active=False)``."""
+  keys = Token.objects.filter(user__in=users).values_list("key", flat=True)
+  cache.delete_many([token_cache_key(key) for key in keys])
+
+
+def token_key(header):
+  """Key of an ``Authorization: Token <key>`` header, or None for any other kind of header.
+
+  Raises AuthenticationFailed for a malformed token header, with DRF's messages.
+  """
+  parts = header.split()
+  if not parts or parts[0].lower() != KEYWORD.lower():
+    return None
+  if len(parts) == 1:
+    raise exceptions.AuthenticationFailed("Invalid token header. No credentials provided.")
+  if len(parts) > 2:
+    raise exceptions.AuthenticationFailed("Invalid token header. Token string should not contain spaces.")
+  return parts[1]
+
+
+def token_user(token):
+  """User of a token from ``cached_token``, raising AuthenticationFailed when it cannot log in."""
+  if token is None:
+    raise exceptions.AuthenticationFailed(INVALID_TOKEN)
+  if not token.user.is_active:
+    raise exceptions.AuthenticationFailed(INACTIVE_USER)
+  return token.user
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+  """TokenAuthentication through the token cache. shop.async_views authenticates with the same helpers."""
+  keyword = KEYWORD
+
+  def authenticate(self, request):
+    key = token_key(request.headers.get("Authorization", ""))
+    if key is None:
+      return None
+    return self.authenticate_credentials(key)
+
+  def authenticate_credentials(self, key):
+    token = cached_token(key)
+    return token_user(token), token
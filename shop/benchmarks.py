@@ -0,0 +1,364 @@
+import asyncio
+import random
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIHandler
+from django.core.signals import request_finished, request_started
+from django.core.cache import cache
+from django.db import close_old_connections, connection, connections
+from django.test import AsyncClient, Client, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import NoReverseMatch, include, path, reverse
+from django.utils.timezone import now
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+from . import events, representations, rollups
+from .authentication import CachedTokenAuthentication, cached_token
+from .models import Category, Order, OrderItem, Payment, Product, Settings, Team, TeamMember
+from .pricing import DEFAULT_MARGIN
+from .serializers import OrderSerializer, ProductSerializer
+from .urls import async_urlpatterns, router
+
+# Both serving modes side by side, used as ROOT_URLCONF by serving_throughput()
+urlpatterns = [
+  path("wsgi/", include(router.urls)),
+  path("asgi/", include(async_urlpatterns)),
+]
+
+POLLED_PATHS = ["products/", "categories/", "analytics/summary/", "analytics/sales-over-time/", "analytics/top-products/"]
+
+
+def percentile(values, fraction):
+  ordered = sorted(values)
+  return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def seed(products=2000, orders=20000, members=300, days=120, random_seed=0):
+  """Fill the (empty, test) database with a synthetic but realistic shop history."""
+  rng = random.Random(random_seed)
+  Settings.objects.get_or_create(defaults={"margin_percentage": DEFAULT_MARGIN})
+
+  teams = Team.objects.bulk_create(
+    Team(number=number, start_date=date(2025, 9, 1) + timedelta(days=number * 30)) for number in range(1, 6)
+  )
+  team_members = TeamMember.objects.bulk_create(
+    TeamMember(name=f"Member {i}", email=f"member{i}@example.com", team=teams[i % len(teams)])
+    for i in range(members)
+  )
+  categories = Category.objects.bulk_create(
+    Category(name=f"Category {i}", icon="icon", visible=i % 7 != 6) for i in range(12)
+  )
+
+  catalogue = []
+  for i in range(products):
+    product = Product(
+      name=f"Product {i}", image=f"product_images/product_{i}.png", category=rng.choice(categories),
+      cost_ex_btw=Decimal(rng.randint(300, 4000)) / 100, pack_size=rng.choice([6, 12, 24]),
+      btw=rng.choice([0, 9, 21]), visible=rng.random() > 0.1,
+    )
+    product.update_prices(DEFAULT_MARGIN)
+    catalogue.append(product)
+  catalogue = Product.objects.bulk_create(catalogue, batch_size=500)
+
+  # Popular products are ordered far more often than the long tail
+  weights = [1 / (rank + 1) for rank in range(len(catalogue))]
+  new_orders = Order.objects.bulk_create(
+    (Order(by=rng.choice(team_members), total_amount=0) for _ in range(orders)), batch_size=1000,
+  )
+
+  items = []
+  for order in new_orders:
+    lines = {product.pk: product for product in rng.choices(catalogue, weights, k=rng.randint(1, 4))}
+    order_items = [
+      OrderItem(order=order, product=product, quantity=rng.randint(1, 3), unit_price=product.sale_price, btw=product.btw)
+      for product in lines.values()
+    ]
+    order.total_amount = sum(item.quantity * item.unit_price for item in order_items)
+    items.extend(order_items)
+  OrderItem.objects.bulk_create(items, batch_size=1000)
+  Order.objects.bulk_update(new_orders, ["total_amount"], batch_size=1000)
+
+  # auto_now_add cannot be overridden on insert, so the history is spread out afterwards
+  today = now()
+  for day in range(days):
+    Order.objects.filter(pk__in=[order.pk for order in new_orders[day::days]]).update(datetime=today - timedelta(days=day))
+
+  Payment.objects.bulk_create(
+    (
+      Payment(by=rng.choice(team_members), amount=Decimal(rng.randint(5, 50)), completed=rng.random() > 0.2)
+      for _ in range(members * 3)
+    ),
+    batch_size=1000,
+  )
+
+  rollups.rebuild_product_counters()
+  rollups.rebuild_daily_sales()
+
+
+def routes():
+  """``(name, method, url, payload)`` for every route registered on the shop router."""
+  member = TeamMember.objects.first()
+  products = list(Product.objects.values_list("pk", flat=True)[:5])
+  payloads = {
+    "order": {"by": member.pk, "items": [{"product_id": pk, "quantity": 1} for pk in products]},
+    "payment": {"by": member.pk, "amount": "10.00", "description": "Benchmark"},
+  }
+
+  for _, viewset, basename in router.registry:
+    try:
+      yield f"{basename}-list", "get", reverse(f"{basename}-list"), None
+    except NoReverseMatch:
+      pass
+
+    if hasattr(viewset, "create") and basename in payloads:
+      yield f"{basename}-create", "post", reverse(f"{basename}-list"), payloads[basename]
+
+    if hasattr(viewset, "retrieve"):
+      model = viewset.serializer_class.Meta.model
+      yield f"{basename}-detail", "get", reverse(f"{basename}-detail", args=[model.objects.values_list("pk", flat=True).first()]), None
+
+    for extra_action in viewset.get_extra_actions():
+      if not extra_action.detail and "get" in extra_action.mapping:
+        yield f"{basename}-{extra_action.url_name}", "get", reverse(f"{basename}-{extra_action.url_name}"), None
+
+
+def measure(client, method, url, payload=None, iterations=10, warm=False):
+  timings, queries, size = [], 0, 0
+  for _ in range(iterations):
+    if not warm:
+      cache.clear()
+    with CaptureQueriesContext(connection) as ctx:
+      start = time.perf_counter()
+      response = getattr(client, method)(url, data=payload, format="json" if payload else None)
+      content = b"".join(response.streaming_content) if response.streaming else response.content
+      timings.append((time.perf_counter() - start) * 1000)
+    queries, size = len(ctx.captured_queries), len(content)
+
+  return {
+    "url": url,
+    "method": method.upper(),
+    "status": response.status_code,
+    "queries": queries,
+    "p50_ms": round(percentile(timings, 0.5), 2),
+    "p95_ms": round(percentile(timings, 0.95), 2),
+    "response_bytes": size,
+  }
+
+
+def run(iterations=10, warm=False):
+  user, _ = User.objects.get_or_create(username="benchmark")
+  client = APIClient()
+  client.force_authenticate(user)
+  return {
+    name: measure(client, method, url, payload, iterations=iterations, warm=warm)
+    for name, method, url, payload in routes()
+  }
+
+
+def compare(previous, current):
+  """Metrics that changed per route between two benchmark results, as ``(current, previous)``."""
+  changes = {}
+  for name, result in current["results"].items():
+    before = previous.get("results", {}).get(name)
+    if before is None:
+      continue
+    changed = {
+      metric: (result[metric], before[metric])
+      for metric in ("queries", "p50_ms", "p95_ms", "response_bytes")
+      if result[metric] != before[metric]
+    }
+    if changed:
+      changes[name] = changed
+  return changes
+
+
+def auth_queries(requests=20):
+  """Authentication queries per request of DRF's TokenAuthentication and CachedTokenAuthentication."""
+  user, _ = User.objects.get_or_create(username="benchmark")
+  token, _ = Token.objects.get_or_create(user=user)
+  request = RequestFactory().get("/api/products/", headers={"Authorization": f"Token {token.key}"})
+
+  results = {}
+  for name, authentication in (("token", TokenAuthentication()), ("cached_token", CachedTokenAuthentication())):
+    cache.clear()
+    with CaptureQueriesContext(connection) as ctx:
+      for _ in range(requests):
+        authentication.authenticate(request)
+    results[name] = round(len(ctx.captured_queries) / requests, 2)
+  return results
+
+
+def best_cpu_time(build, iterations):
+  """Lowest CPU time in milliseconds of ``build()`` over ``iterations`` runs, and its JSON output."""
+  timings = []
+  for _ in range(iterations):
+    start = time.process_time()
+    content = JSONRenderer().render(build())
+    timings.append((time.process_time() - start) * 1000)
+  return round(min(timings), 2), content
+
+
+def serializer_speed(orders=500, iterations=5):
+  """CPU time of the product and order lists through the serializers and the lean representations.
+
+  Both include fetching the rows and rendering JSON, and must produce identical bytes.
+  """
+  request = Request(RequestFactory().get("/api/orders/"))
+  products = Product.objects.select_related("category").order_by("-total_ordered", "id")
+  recent = Order.objects.order_by("-datetime", "-id")[:orders]
+  lists = {
+    "products": (
+      lambda: ProductSerializer(products, many=True, context={"request": request}).data,
+      lambda: representations.products(products.values(*representations.PRODUCT_VALUES), request),
+    ),
+    "orders": (
+      lambda: OrderSerializer(
+        recent.prefetch_related("items__product__category"), many=True, context={"request": request},
+      ).data,
+      lambda: representations.orders(recent.values(*representations.ORDER_VALUES), request),
+    ),
+  }
+
+  results = {}
+  for name, (serializer, lean) in lists.items():
+    serializer_ms, expected = best_cpu_time(serializer, iterations)
+    lean_ms, content = best_cpu_time(lean, iterations)
+    results[name] = {
+      "identical": content == expected,
+      "serializer_cpu_ms": serializer_ms,
+      "lean_cpu_ms": lean_ms,
+      "speedup": round(serializer_ms / lean_ms, 1) if lean_ms else None,
+      "response_bytes": len(content),
+    }
+  return results
+
+
+def wsgi_throughput(paths, headers, concurrency, requests):
+  def poll(count):
+    client = Client(headers=headers)
+    try:
+      for i in range(count):
+        client.get(paths[i % len(paths)])
+    finally:
+      connections.close_all()
+
+  start = time.perf_counter()
+  with ThreadPoolExecutor(concurrency) as pool:
+    list(pool.map(poll, [requests // concurrency] * concurrency))
+  return time.perf_counter() - start
+
+
+async def asgi_throughput(paths, headers, concurrency, requests):
+  client = AsyncClient()
+
+  async def poll(count):
+    for i in range(count):
+      await client.get(paths[i % len(paths)], headers=headers)
+
+  start = time.perf_counter()
+  await asyncio.gather(*(poll(requests // concurrency) for _ in range(concurrency)))
+  return time.perf_counter() - start
+
+
+async def hold_event_streams(application, path, headers, connections):
+  """Connect idle clients to the event stream through ``application`` and measure them.
+
+  Returns the traced memory per connection and whether an event published while they were
+  connected reached every client.
+  """
+  disconnect = asyncio.Event()
+  received = [asyncio.Queue() for _ in range(connections)]
+  scope = {
+    "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+    "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+    "headers": [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+    "client": ("127.0.0.1", 0), "server": ("testserver", 80),
+  }
+
+  def connect(queue):
+    requested = False
+
+    async def receive():
+      nonlocal requested
+      if not requested:
+        requested = True
+        return {"type": "http.request", "body": b"", "more_body": False}
+      await disconnect.wait()
+      return {"type": "http.disconnect"}
+
+    async def send(message):
+      if message["type"] == "http.response.body" and message.get("body"):
+        queue.put_nowait(message["body"].decode())
+
+    return application(dict(scope), receive, send)
+
+  # The first client pays for one-off imports and URL resolver caches, it is not counted
+  clients = [asyncio.create_task(connect(received[0]))]
+  await received[0].get()
+
+  tracemalloc.start()
+  before = tracemalloc.get_traced_memory()[0]
+  clients += [asyncio.create_task(connect(queue)) for queue in received[1:]]
+  await asyncio.gather(*(queue.get() for queue in received[1:]))
+  per_connection = (tracemalloc.get_traced_memory()[0] - before) / (connections - 1)
+  tracemalloc.stop()
+
+  events.get_bus().publish({"type": "settings", "data": {"margin_percentage": "10.00"}})
+  chunks = await asyncio.wait_for(asyncio.gather(*(queue.get() for queue in received)), timeout=10)
+
+  disconnect.set()
+  await asyncio.gather(*clients)
+  return per_connection, all(chunk.startswith("event: settings") for chunk in chunks)
+
+
+def event_stream_memory(connections=300):
+  """Traced memory per idle /api/events/ connection served by the ASGI handler."""
+  user, _ = User.objects.get_or_create(username="benchmark")
+  token, _ = Token.objects.get_or_create(user=user)
+  # Cached up front, so the streams never need the (possibly uncommitted) token row
+  cached_token(token.key)
+
+  # Like the test client, keep the request signals from closing the current connection
+  request_started.disconnect(close_old_connections)
+  request_finished.disconnect(close_old_connections)
+  try:
+    with override_settings(ROOT_URLCONF=__name__):
+      per_connection, delivered = asyncio.run(hold_event_streams(
+        ASGIHandler(), "/asgi/api/events/", {"Authorization": f"Token {token.key}"}, connections,
+      ))
+  finally:
+    request_started.connect(close_old_connections)
+    request_finished.connect(close_old_connections)
+
+  return {
+    "connections": connections,
+    "bytes_per_connection": round(per_connection),
+    "subscribers_after_disconnect": len(events.get_bus().subscriptions),
+    "event_delivered_to_all": delivered,
+  }
+
+
+def serving_throughput(concurrency=20, requests=400):
+  """Requests per second of the sync viewsets and the async views under concurrent tablet polling."""
+  user, _ = User.objects.get_or_create(username="benchmark")
+  token, _ = Token.objects.get_or_create(user=user)
+  headers = {"Authorization": f"Token {token.key}"}
+  requests -= requests % concurrency
+
+  with override_settings(ROOT_URLCONF=__name__):
+    wsgi = wsgi_throughput([f"/wsgi/{p}" for p in POLLED_PATHS], headers, concurrency, requests)
+    asgi = asyncio.run(asgi_throughput([f"/asgi/api/{p}" for p in POLLED_PATHS], headers, concurrency, requests))
+
+  return {
+    "concurrency": concurrency,
+    "requests": requests,
+    "wsgi_rps": round(requests / wsgi, 1),
+    "asgi_rps": round(requests / asgi, 1),
+  }
@@ -0,0 +1,89 @@
+"""Counting the days the shop is open: weekdays, minus holidays and other closures.
+
+The first shop day is the start date of the earliest team, not a fixed date.
+"""
+import asyncio
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Min
+from django.utils.timezone import make_aware
+from .cache import acatalogue_version, catalogue_version
+from .models import ClosedDay, Team
+
+
+def start_of_day(day):
+  """Midnight at the start of ``day`` in the current time zone, to filter datetimes by day with an index."""
+  return make_aware(datetime.combine(day, datetime.min.time()))
+
+
+def weekdays_between(start, end):
+  """Number of Monday to Friday dates in ``[start, end]``, without visiting each day."""
+  if end < start:
+    return 0
+  weeks, rest = divmod((end - start).days + 1, 7)
+  weekday = start.weekday()
+  # The remaining days run from weekday onwards, possibly wrapping into the next week
+  return weeks * 5 + min(rest, max(0, 5 - weekday)) + max(0, rest - (7 - weekday))
+
+
+class Calendar:
+  def __init__(self, start_date, closed_dates):
+    self.start_date = start_date
+    self.closed_dates = {day for day in closed_dates if day.weekday() < 5}
+
+  def open_days_between(self, start, end):
+    if end < start:
+      return 0
+    closed = sum(1 for day in self.closed_dates if start <= day <= end)
+    return weekdays_between(start, end) - closed
+
+  def open_days(self, end):
+    """Open days from the first shop day up to and including ``end``."""
+    if self.start_date is None:
+      return 0
+    return self.open_days_between(self.start_date, end)
+
+  def is_open(self, day):
+    return day.weekday() < 5 and day not in self.closed_dates
+
+  def open_dates(self, start, end):
+    day = start
+    while day <= end:
+      if self.is_open(day):
+        yield day
+      day += timedelta(days=1)
+
+
+FIRST_DAY = {"start_date": Min("start_date")}
+
+
+def closed_dates_query():
+  return ClosedDay.objects.values_list("date", flat=True)
+
+
+# Teams and closed days bump the catalogue version when they change
+def calendar_cache_key(version):
+  return f"catalogue:{version}:calendar"
+
+
+def calendar():
+  key = calendar_cache_key(catalogue_version())
+  cached = cache.get(key)
+  if cached is None:
+    cached = Calendar(Team.objects.aggregate(**FIRST_DAY)["start_date"], list(closed_dates_query()))
+    cache.set(key, cached, settings.CATALOGUE_CACHE_TIMEOUT)
+  return cached
+
+
+async def acalendar():
+  key = calendar_cache_key(await acatalogue_version())
+  cached = await cache.aget(key)
+  if cached is None:
+    async def closed_dates():
+      return [day async for day in closed_dates_query()]
+
+    first_day, closed = await asyncio.gather(Team.objects.aaggregate(**FIRST_DAY), closed_dates())
+    cached = Calendar(first_day["start_date"], closed)
+    await cache.aset(key, cached, settings.CATALOGUE_CACHE_TIMEOUT)
+  return cached
@@ -0,0 +1,93 @@
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+CATALOGUE_VERSION_KEY = "catalogue:version"
+
+
+def catalogue_version():
+  """Current catalogue version: the time in nanoseconds of the last change."""
+  version = cache.get(CATALOGUE_VERSION_KEY)
+  if version is None:
+    cache.add(CATALOGUE_VERSION_KEY, time.time_ns(), timeout=None)
+    version = cache.get(CATALOGUE_VERSION_KEY)
+  return version
+
+
+async def acatalogue_version():
+  version = await cache.aget(CATALOGUE_VERSION_KEY)
+  if version is None:
+    await cache.aadd(CATALOGUE_VERSION_KEY, time.time_ns(), timeout=None)
+    version = await cache.aget(CATALOGUE_VERSION_KEY)
+  return version
+
+
+def bump_catalogue_version():
+  cache.set(CATALOGUE_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+class CatalogueResponse:
+  """Cache key of one catalogue request at a given catalogue version, and the validators of its body.
+
+  The ETag is a hash of the rendered body and Last-Modified the time it was built, both
+  cached with the data. Product ordering follows total_ordered, which changes without a
+  version bump, so a body rebuilt after the timeout only keeps its ETag if it is unchanged.
+  """
+
+  def __init__(self, request, version):
+    params = sorted(request.GET.lists())
+    # Scheme and host are part of the key because image URLs are absolute
+    self.key = f"catalogue:{version}:{request.build_absolute_uri(request.path)}:{params}"
+    self.entry = None
+
+  def build(self, data):
+    """Cache entry for freshly built ``data``."""
+    content = JSONRenderer().render(data)
+    self.entry = {"data": data, "etag": f'"{hashlib.md5(content).hexdigest()}"', "last_modified": int(time.time())}
+    return self.entry
+
+  def is_not_modified(self, request):
+    if "If-None-Match" in request.headers:
+      return request.headers["If-None-Match"] == self.entry["etag"]
+    if_modified_since = parse_http_date_safe(request.headers.get("If-Modified-Since", ""))
+    return bool(if_modified_since) and if_modified_since >= self.entry["last_modified"]
+
+  def add_headers(self, response):
+    response["ETag"] = self.entry["etag"]
+    response["Last-Modified"] = http_date(self.entry["last_modified"])
+    response["Cache-Control"] = "no-cache"
+    return response
+
+
+class CachedResponseMixin:
+  """Cache list and detail responses of read-only viewsets under the catalogue version.
+
+  Old entries are never deleted, they simply stop being looked up once the version
+  is bumped and expire after ``CATALOGUE_CACHE_TIMEOUT`` seconds.
+  """
+
+  def list(self, request, *args, **kwargs):
+    return self.cached_response(super().list, request, *args, **kwargs)
+
+  def retrieve(self, request, *args, **kwargs):
+    return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+  def cached_response(self, handler, request, *args, **kwargs):
+    cached = CatalogueResponse(request, catalogue_version())
+    cached.entry = cache.get(cached.key)
+    if cached.entry is None:
+      response = handler(request, *args, **kwargs)
+      if response.status_code != status.HTTP_200_OK:
+        return response
+      cache.set(cached.key, cached.build(response.data), settings.CATALOGUE_CACHE_TIMEOUT)
+    else:
+      response = Response(cached.entry["data"])
+
+    if cached.is_not_modified(request):
+      response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    return cached.add_headers(response)
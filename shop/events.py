@@ -0,0 +1,129 @@
+"""Push channel for connected tablets: balance, product and settings changes as server-sent events.
+
+Events are published after the transaction that caused them commits, to the bus configured by
+``EVENT_BUS_BACKEND``. The default InProcessBus only reaches clients connected to the same
+process. Running several ASGI workers needs a backend that fans out between them, such as
+one on Redis pub/sub, implementing the same ``publish``, ``subscribe`` and ``listening`` methods.
+"""
+import asyncio
+import json
+import threading
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+from .models import TeamMember
+
+# Comment lines sent while idle, so proxies do not close the connection
+HEARTBEAT_SECONDS = 15
+QUEUE_SIZE = 100
+
+
+class Subscription:
+  """Events for one connected client, delivered to a bounded queue on the client's event loop."""
+
+  def __init__(self, bus, maxsize=QUEUE_SIZE):
+    self.bus = bus
+    self.loop = asyncio.get_running_loop()
+    self.queue = asyncio.Queue(maxsize)
+    self.overflowed = False
+
+  def deliver(self, event):
+    """Called from any thread. Returns False when the client's event loop is gone."""
+    try:
+      self.loop.call_soon_threadsafe(self.put, event)
+    except RuntimeError:
+      return False
+    return True
+
+  def put(self, event):
+    try:
+      self.queue.put_nowait(event)
+    except asyncio.QueueFull:
+      # A client that stopped reading misses events and is told to sync again instead
+      self.overflowed = True
+
+  async def get(self, timeout=HEARTBEAT_SECONDS):
+    """The next event, or None when nothing happened within ``timeout`` seconds."""
+    try:
+      return await asyncio.wait_for(self.queue.get(), timeout)
+    except asyncio.TimeoutError:
+      return None
+
+  def close(self):
+    self.bus.unsubscribe(self)
+
+
+class InProcessBus:
+  def __init__(self):
+    self.subscriptions = set()
+    self.lock = threading.Lock()
+
+  def subscribe(self):
+    subscription = Subscription(self)
+    with self.lock:
+      self.subscriptions.add(subscription)
+    return subscription
+
+  def unsubscribe(self, subscription):
+    with self.lock:
+      self.subscriptions.discard(subscription)
+
+  def listening(self):
+    return bool(self.subscriptions)
+
+  def publish(self, event):
+    with self.lock:
+      subscriptions = list(self.subscriptions)
+    for subscription in subscriptions:
+      if not subscription.deliver(event):
+        self.unsubscribe(subscription)
+
+
+_bus = None
+
+
+def get_bus():
+  global _bus
+  if _bus is None:
+    _bus = import_string(settings.EVENT_BUS_BACKEND)()
+  return _bus
+
+
+def publish(event_type, data):
+  """Send an event to every connected client once the current transaction commits."""
+  transaction.on_commit(lambda: get_bus().publish({"type": event_type, "data": data}))
+
+
+def publish_balances(member_ids):
+  def send():
+    bus = get_bus()
+    # Reading the new balances is only worth a query when someone is connected
+    if not bus.listening():
+      return
+    for pk, balance in TeamMember.objects.filter(pk__in=member_ids).values_list("pk", "balance"):
+      bus.publish({"type": "balance", "data": {"member": pk, "balance": balance}})
+  transaction.on_commit(send)
+
+
+def format_event(event):
+  return f"event: {event['type']}\ndata: {json.dumps(event['data'], cls=DjangoJSONEncoder)}\n\n"
+
+
+async def stream(bus=None):
+  """Server-sent event lines for one client, until the client disconnects."""
+  subscription = (bus or get_bus()).subscribe()
+  try:
+    # Sent after subscribing, so a client that received it cannot miss later events
+    yield "retry: 5000\n: connected\n\n"
+    while True:
+      event = await subscription.get()
+      if subscription.overflowed:
+        subscription.overflowed = False
+        yield format_event({"type": "resync", "data": {}})
+      if event is None:
+        yield ": ping\n\n"
+      else:
+        yield format_event(event)
+  finally:
+    subscription.close()
@@ -0,0 +1,156 @@
+"""Streaming exports of order lines and payments for the accountants.
+
+Rows are read with ``.iterator()`` and written one at a time, so memory use does not grow
+with the size of the period. Order line exports end with a subtotal per BTW rate.
+"""
+import csv
+import json
+from decimal import Decimal
+from django.db.models import DecimalField, ExpressionWrapper, F
+from django.utils.timezone import localtime
+from .models import BTW_CHOICES, OrderItem, Payment
+
+CHUNK_SIZE = 2000
+CENT = Decimal("0.01")
+
+ORDER_ITEM_COLUMNS = [
+  "order", "datetime", "member", "team", "product", "category", "btw",
+  "quantity", "unit_price", "line_total", "unit_cost", "margin",
+]
+PAYMENT_COLUMNS = ["payment", "member", "team", "amount", "completed", "description"]
+SUBTOTAL_COLUMNS = ["btw", "units", "net", "btw_amount", "gross"]
+
+
+def order_item_queryset(start=None, end=None, team=None):
+  queryset = OrderItem.objects.all()
+  if start is not None:
+    queryset = queryset.filter(order__datetime__gte=start)
+  if end is not None:
+    queryset = queryset.filter(order__datetime__lt=end)
+  if team is not None:
+    queryset = queryset.filter(order__by__team_id=team)
+
+  line_total = ExpressionWrapper(F("quantity") * F("unit_price"), output_field=DecimalField(max_digits=10, decimal_places=2))
+  return queryset.order_by("order__datetime", "order_id", "id").values(
+    "order_id", "quantity", "unit_price", "btw",
+    datetime=F("order__datetime"), member=F("order__by__name"),
+    team=F("order__by__team__number"), product_name=F("product__name"), category=F("product__category__name"),
+    unit_cost=F("product__unit_cost"), line_total=line_total,
+  )
+
+
+def order_item_rows(start=None, end=None, team=None):
+  """Order lines between the ``start`` and ``end`` datetimes, oldest first.
+
+  ``unit_cost`` is the product's current value, order lines only store the price and
+  BTW rate they were sold at.
+  """
+  rows = order_item_queryset(start, end, team)
+  for row in rows.iterator(chunk_size=CHUNK_SIZE):
+    line_total = row["line_total"].quantize(CENT)
+    unit_cost = (row["unit_cost"] * row["quantity"]).quantize(CENT)
+    yield {
+      "order": row["order_id"],
+      "datetime": localtime(row["datetime"]).isoformat(),
+      "member": row["member"],
+      "team": row["team"],
+      "product": row["product_name"],
+      "category": row["category"],
+      "btw": row["btw"],
+      "quantity": row["quantity"],
+      "unit_price": row["unit_price"],
+      "line_total": line_total,
+      "unit_cost": unit_cost,
+      "margin": line_total - unit_cost,
+    }
+
+
+def payment_rows(team=None, completed=None):
+  """Payments, oldest first. They carry no date, so they cannot be limited to a period."""
+  queryset = Payment.objects.all()
+  if team is not None:
+    queryset = queryset.filter(by__team_id=team)
+  if completed is not None:
+    queryset = queryset.completed(completed)
+
+  rows = queryset.order_by("id").values(
+    "amount", "completed", "description", payment=F("id"), member=F("by__name"), team=F("by__team__number"),
+  )
+  for row in rows.iterator(chunk_size=CHUNK_SIZE):
+    yield {column: row[column] for column in PAYMENT_COLUMNS}
+
+
+class BtwSubtotals:
+  """Running totals per BTW rate of the order lines passed through ``add``."""
+
+  def __init__(self):
+    self.totals = {rate: {"units": 0, "gross": Decimal("0.00")} for rate, _ in BTW_CHOICES}
+
+  def add(self, row):
+    totals = self.totals.setdefault(row["btw"], {"units": 0, "gross": Decimal("0.00")})
+    totals["units"] += row["quantity"]
+    totals["gross"] += row["line_total"]
+    return row
+
+  def rows(self):
+    # Prices include BTW, so the net amount is taken out of the gross total per rate
+    for rate, totals in sorted(self.totals.items()):
+      net = (totals["gross"] / (1 + Decimal(rate) / 100)).quantize(CENT)
+      yield {"btw": rate, "units": totals["units"], "net": net, "btw_amount": totals["gross"] - net, "gross": totals["gross"]}
+
+
+class Echo:
+  """File-like object whose ``write`` hands back the line instead of storing it."""
+
+  def write(self, value):
+    return value
+
+
+def stream_csv(rows, columns, subtotals=None):
+  writer = csv.writer(Echo())
+  yield writer.writerow(columns)
+  for row in rows:
+    yield writer.writerow([row[column] for column in columns])
+
+  if subtotals is not None:
+    yield writer.writerow([])
+    yield writer.writerow(SUBTOTAL_COLUMNS)
+    for row in subtotals.rows():
+      yield writer.writerow([row[column] for column in SUBTOTAL_COLUMNS])
+
+
+def stream_jsonl(rows, record_type, subtotals=None):
+  for row in rows:
+    yield json.dumps({"type": record_type, **row}, default=str) + "\n"
+
+  if subtotals is not None:
+    for row in subtotals.rows():
+      yield json.dumps({"type": "btw_subtotal", **row}, default=str) + "\n"
+
+
+CONTENT_TYPES = {
+  "csv": "text/csv",
+  "jsonl": "application/x-ndjson",
+}
+
+
+def export(kind, output="csv", start=None, end=None, team=None, completed=None):
+  """Chunks of the ``kind`` ("orders" or "payments") export in the ``output`` format."""
+  if kind == "orders":
+    subtotals = BtwSubtotals()
+    rows = map(subtotals.add, order_item_rows(start, end, team))
+    columns, record_type = ORDER_ITEM_COLUMNS, "order_item"
+  else:
+    subtotals = None
+    rows = payment_rows(team, completed)
+    columns, record_type = PAYMENT_COLUMNS, "payment"
+
+  if output == "jsonl":
+    return stream_jsonl(rows, record_type, subtotals)
+  return stream_csv(rows, columns, subtotals)
+
+
+def filename(kind, output, start_date=None, end_date=None):
+  period = "-".join(day.isoformat() for day in (start_date, end_date) if day is not None)
+  return f"{kind}{'-' + period if period else ''}.{output}"
+
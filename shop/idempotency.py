@@ -0,0 +1,76 @@
+"""Idempotency-Key support for create endpoints, so tablets can safely retry a POST.
+
+The first successful response is stored with the key. A retry with the same key gets that
+response back without running the create again. Keys are purged after
+``IDEMPOTENCY_KEY_TTL`` seconds by the purge_idempotency_keys task.
+"""
+import hashlib
+import json
+from django.db import IntegrityError, transaction
+from django.utils.timezone import now
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from . import tasks
+from .models import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+
+
+def fingerprint(data):
+  """Hash of the request body, uploaded files count by name."""
+  return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def replay(record, request_fingerprint):
+  if record.fingerprint != request_fingerprint:
+    return Response(
+      {"detail": f"This {HEADER} was already used for a different request."},
+      status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+    )
+  return Response(record.response, status=record.status_code, headers={"Idempotent-Replayed": "true"})
+
+
+def schedule_purge():
+  # Keyed by the hour, so at most one purge is queued per hour however many orders come in
+  tasks.enqueue("purge_idempotency_keys", key=f"purge-idempotency-keys:{now():%Y%m%d%H}")
+
+
+class IdempotentCreateMixin:
+  """Honour an ``Idempotency-Key`` header on ``create``, scoped per user and ``idempotency_scope``."""
+  idempotency_scope = None
+
+  def create(self, request, *args, **kwargs):
+    key = request.headers.get(HEADER)
+    if key is None:
+      return super().create(request, *args, **kwargs)
+    if not 0 < len(key) <= 255:
+      raise ValidationError({HEADER: "Must be between 1 and 255 characters."})
+
+    lookup = {"user": request.user, "scope": self.idempotency_scope, "key": key}
+    request_fingerprint = fingerprint(request.data)
+    record = IdempotencyKey.objects.filter(**lookup).first()
+    if record is not None:
+      return replay(record, request_fingerprint)
+
+    try:
+      # The key is stored in the same transaction as the created rows. A concurrent retry
+      # that loses the race on the unique constraint rolls its rows back and replays instead
+      with transaction.atomic():
+        response = super().create(request, *args, **kwargs)
+        if status.is_success(response.status_code):
+          IdempotencyKey.objects.create(
+            **lookup, fingerprint=request_fingerprint, status_code=response.status_code, response=response.data,
+          )
+    except IntegrityError:
+      record = IdempotencyKey.objects.filter(**lookup).first()
+      if record is None:
+        # The competing request has inserted the key but not committed yet
+        return Response(
+          {"detail": f"A request with this {HEADER} is still in progress."},
+          status=status.HTTP_409_CONFLICT,
+        )
+      return replay(record, request_fingerprint)
+
+    schedule_purge()
+    return response
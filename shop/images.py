@@ -0,0 +1,77 @@
+import hashlib
+import logging
+from io import BytesIO
+from django.core.files.base import ContentFile
+from django.utils.timezone import now
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Longest side in pixels of each derivative
+PRODUCT_IMAGE_SIZES = {"thumb": 160, "medium": 480}
+PROOF_IMAGE_SIZES = {"thumb": 240}
+
+FORMATS = {"webp": "WEBP", "jpg": "JPEG"}
+
+
+def generate_derivatives(field_file, sizes, folder="derivatives"):
+  """Resize an uploaded image into WebP and JPEG variants stored under content-hashed names.
+
+  Returns ``{"source": name, "<size name>": {"webp": path, "jpg": path}}``, or None when the
+  file is missing or not an image. Files that already exist are reused, so running this
+  twice for the same upload is cheap.
+  """
+  storage = field_file.storage
+  if not field_file.name or not storage.exists(field_file.name):
+    return None
+
+  with storage.open(field_file.name, "rb") as f:
+    data = f.read()
+  digest = hashlib.sha256(data).hexdigest()[:16]
+
+  try:
+    image = ImageOps.exif_transpose(Image.open(BytesIO(data)))
+  except (OSError, ValueError):
+    logger.warning("Could not read image %s", field_file.name)
+    return None
+
+  variants = {"source": field_file.name}
+  for name, size in sizes.items():
+    resized = image.copy()
+    resized.thumbnail((size, size))
+    variants[name] = {}
+    for extension, image_format in FORMATS.items():
+      path = f"{folder}/{digest}_{size}.{extension}"
+      if not storage.exists(path):
+        buffer = BytesIO()
+        converted = resized if image_format == "WEBP" else resized.convert("RGB")
+        converted.save(buffer, image_format, quality=80)
+        path = storage.save(path, ContentFile(buffer.getvalue()))
+      variants[name][extension] = path
+  return variants
+
+
+def process_product_image(product, force=False):
+  from .models import Product
+
+  if not force and product.image_variants.get("source") == product.image.name:
+    return False
+  variants = generate_derivatives(product.image, PRODUCT_IMAGE_SIZES, folder="product_images/derivatives")
+  if variants is None:
+    return False
+  product.image_variants = variants
+  Product.objects.filter(pk=product.pk).update(image_variants=variants, updated_at=now())
+  return True
+
+
+def process_payment_proof(payment, force=False):
+  from .models import Payment
+
+  if not force and payment.proof_variants.get("source") == payment.proof_picture.name:
+    return False
+  variants = generate_derivatives(payment.proof_picture, PROOF_IMAGE_SIZES, folder="payment_proofs/derivatives")
+  if variants is None:
+    return False
+  payment.proof_variants = variants
+  Payment.objects.filter(pk=payment.pk).update(proof_variants=variants)
+  return True
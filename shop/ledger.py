@@ -0,0 +1,86 @@
+from collections import defaultdict
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils.timezone import now
+from . import events
+from .models import BalanceEntry, Payment, TeamMember
+
+
+def record(member_id, amount, kind, order=None, payment=None, description=""):
+  """Append a ledger entry and apply it to the cached balance in one atomic step."""
+  with transaction.atomic():
+    entry = BalanceEntry.objects.create(
+      member_id=member_id, amount=amount, kind=kind,
+      order=order, payment=payment, description=description,
+    )
+    TeamMember.objects.filter(pk=member_id).update(balance=F("balance") + amount, updated_at=now())
+    events.publish_balances([member_id])
+  return entry
+
+
+def complete_payments(payment_ids):
+  """Complete the pending payments among ``payment_ids`` and credit their members.
+
+  The number of statements does not depend on the number of payments: the rows are locked
+  and read once, and every member is credited by one UPDATE. Payments that are already
+  completed, or completed concurrently, are skipped. Returns the ids that were completed.
+  """
+  with transaction.atomic():
+    # The locking read returns the amounts too, so the credits are summed from it rather than
+    # by a second aggregate query (PostgreSQL does not allow FOR UPDATE with GROUP BY)
+    pending = list(
+      Payment.objects.select_for_update().completed(False).filter(pk__in=payment_ids)
+      .order_by("pk").values_list("pk", "by_id", "amount")
+    )
+    if not pending:
+      return []
+
+    Payment.objects.filter(pk__in=[pk for pk, _, _ in pending]).update(completed=True)
+    BalanceEntry.objects.bulk_create(
+      BalanceEntry(member_id=member_id, amount=amount, kind=BalanceEntry.PAYMENT, payment_id=pk)
+      for pk, member_id, amount in pending
+    )
+
+    credits = defaultdict(Decimal)
+    for _, member_id, amount in pending:
+      credits[member_id] += amount
+    TeamMember.objects.filter(pk__in=credits).update(
+      balance=F("balance") + Case(
+        *(When(pk=pk, then=Value(total)) for pk, total in credits.items()),
+        default=Value(Decimal("0")), output_field=DecimalField(max_digits=10, decimal_places=2),
+      ),
+      updated_at=now(),
+    )
+    events.publish_balances(list(credits))
+  return [pk for pk, _, _ in pending]
+
+
+def ledger_balances():
+  """Sum of all ledger entries per member id, in a single aggregate query."""
+  return dict(
+    BalanceEntry.objects.values_list("member").annotate(total=Sum("amount")).order_by()
+  )
+
+
+def reconcile(dry_run=False):
+  """Rebuild cached balances from the ledger, returning the members that had drifted."""
+  totals = ledger_balances()
+  drifted = [
+    (member, totals.get(member.pk, Decimal("0")))
+    for member in TeamMember.objects.only("name", "balance")
+    if member.balance != totals.get(member.pk, Decimal("0"))
+  ]
+
+  if drifted and not dry_run:
+    ledger_total = (
+      BalanceEntry.objects.filter(member=OuterRef("pk"))
+      .values("member").annotate(total=Sum("amount")).values("total")
+    )
+    # The balance is recomputed inside the UPDATE itself so concurrent entries cannot be lost
+    TeamMember.objects.filter(pk__in=[member.pk for member, _ in drifted]).update(
+      balance=Coalesce(Subquery(ledger_total), Value(Decimal("0"))), updated_at=now(),
+    )
+    events.publish_balances([member.pk for member, _ in drifted])
+  return drifted
@@ -0,0 +1,48 @@
+import json
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils.timezone import now
+from shop import benchmarks
+
+
+class Command(BaseCommand):
+  help = "Seed a throwaway database and record query count, latency and size of every API route"
+
+  def add_arguments(self, parser):
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--orders", type=int, default=20000)
+    parser.add_argument("--members", type=int, default=300)
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--warm", action="store_true", help="Keep the response cache between iterations")
+    parser.add_argument("--output", help="Write the JSON results to this file instead of stdout")
+    parser.add_argument("--compare", help="Earlier JSON results to report changes against")
+
+  def handle(self, *args, **options):
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+      benchmarks.seed(products=options["products"], orders=options["orders"], members=options["members"])
+      results = {
+        "created": now().isoformat(),
+        "dataset": {key: options[key] for key in ("products", "orders", "members")},
+        "results": benchmarks.run(iterations=options["iterations"], warm=options["warm"]),
+        "auth_queries_per_request": benchmarks.auth_queries(),
+      }
+    finally:
+      connection.creation.destroy_test_db(old_name, verbosity=0)
+      teardown_test_environment()
+
+    output = json.dumps(results, indent=2)
+    if options["output"]:
+      with open(options["output"], "w") as f:
+        f.write(output)
+    else:
+      self.stdout.write(output)
+
+    if options["compare"]:
+      with open(options["compare"]) as f:
+        changes = benchmarks.compare(json.load(f), results)
+      for name, metrics in changes.items():
+        for metric, (current, previous) in metrics.items():
+          self.stderr.write(f"{name} {metric}: {previous} -> {current}")
@@ -0,0 +1,23 @@
+import json
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from shop import benchmarks
+
+
+class Command(BaseCommand):
+  help = "Hold many idle /api/events/ connections through the ASGI handler and report memory per connection"
+
+  def add_arguments(self, parser):
+    parser.add_argument("--connections", type=int, default=500)
+
+  def handle(self, *args, **options):
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+      result = benchmarks.event_stream_memory(connections=options["connections"])
+    finally:
+      connection.creation.destroy_test_db(old_name, verbosity=0)
+      teardown_test_environment()
+
+    self.stdout.write(json.dumps(result, indent=2))
@@ -0,0 +1,28 @@
+import json
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from shop import benchmarks
+
+
+class Command(BaseCommand):
+  help = "Seed a throwaway database and compare CPU time and output of the serializers and lean list representations"
+
+  def add_arguments(self, parser):
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--orders", type=int, default=20000)
+    parser.add_argument("--members", type=int, default=300)
+    parser.add_argument("--page", type=int, default=500, help="Number of orders in the order list")
+    parser.add_argument("--iterations", type=int, default=5)
+
+  def handle(self, *args, **options):
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+      benchmarks.seed(products=options["products"], orders=options["orders"], members=options["members"])
+      results = benchmarks.serializer_speed(orders=options["page"], iterations=options["iterations"])
+    finally:
+      connection.creation.destroy_test_db(old_name, verbosity=0)
+      teardown_test_environment()
+
+    self.stdout.write(json.dumps(results, indent=2))
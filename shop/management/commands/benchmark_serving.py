@@ -0,0 +1,31 @@
+import json
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from shop import benchmarks
+
+
+class Command(BaseCommand):
+  help = "Compare WSGI and ASGI throughput of the polled read endpoints on a throwaway database"
+
+  def add_arguments(self, parser):
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--members", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=400)
+
+  def handle(self, *args, **options):
+    setup_test_environment()
+    # A file database, so the worker threads share the data instead of each opening an empty one
+    if connection.vendor == "sqlite":
+      connection.settings_dict["TEST"]["NAME"] = "benchmark.sqlite3"
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+      benchmarks.seed(products=options["products"], orders=options["orders"], members=options["members"])
+      result = benchmarks.serving_throughput(concurrency=options["concurrency"], requests=options["requests"])
+    finally:
+      connection.creation.destroy_test_db(old_name, verbosity=0)
+      teardown_test_environment()
+
+    self.stdout.write(json.dumps(result, indent=2))
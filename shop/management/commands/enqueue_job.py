@@ -0,0 +1,20 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from shop import tasks
+
+
+class Command(BaseCommand):
+  help = "Queue a background job, e.g. rebuild_daily_sales or reconcile_balances"
+
+  def add_arguments(self, parser):
+    parser.add_argument("name", choices=sorted(tasks.registry))
+    parser.add_argument("--payload", default="{}", help="JSON keyword arguments for the task")
+    parser.add_argument("--key", help="Idempotency key, the job is not queued again while one with this key exists")
+
+  def handle(self, *args, **options):
+    try:
+      payload = json.loads(options["payload"])
+    except ValueError as e:
+      raise CommandError(f"Invalid payload: {e}")
+    job = tasks.enqueue(options["name"], payload, key=options["key"])
+    self.stdout.write(self.style.SUCCESS(f"Queued {job}." if job else "Ran the task right away (TASKS_EAGER)."))
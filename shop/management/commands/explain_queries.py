@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from shop import query_plans
+
+
+class Command(BaseCommand):
+  help = "EXPLAIN the main querysets of the API and flag full table scans"
+
+  def add_arguments(self, parser):
+    parser.add_argument("--verbose-plans", action="store_true", help="Print every plan, not only flagged ones")
+    parser.add_argument("--fail-on-scan", action="store_true", help="Exit with an error when a full scan is found")
+
+  def handle(self, *args, **options):
+    flagged = []
+    for name, plan, scans in query_plans.audit():
+      if scans:
+        flagged.append(name)
+        self.stdout.write(self.style.WARNING(f"{name}: full scan"))
+        for line in scans:
+          self.stdout.write(f"  {line}")
+      else:
+        self.stdout.write(self.style.SUCCESS(f"{name}: ok"))
+
+      if options["verbose_plans"]:
+        self.stdout.write(f"{plan}\n")
+
+    self.stdout.write(f"{len(flagged)} queries with full scans on {connection.vendor}.")
+    if flagged and options["fail_on_scan"]:
+      raise CommandError(f"Full scans in: {', '.join(flagged)}")
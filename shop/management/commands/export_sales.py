@@ -0,0 +1,38 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from shop import exports
+from shop.business_days import start_of_day
+
+
+def day(value):
+  parsed = parse_date(value)
+  if parsed is None:
+    raise CommandError(f"{value} is not a YYYY-MM-DD date.")
+  return parsed
+
+
+class Command(BaseCommand):
+  help = "Stream all order lines (with BTW subtotals) or payments to a CSV or JSON lines file"
+
+  def add_arguments(self, parser):
+    parser.add_argument("kind", choices=["orders", "payments"])
+    parser.add_argument("--start", type=day, help="First day to include (orders only)")
+    parser.add_argument("--end", type=day, help="Last day to include (orders only)")
+    parser.add_argument("--team", type=int, help="Only members of this team id")
+    parser.add_argument("--format", choices=list(exports.CONTENT_TYPES), default="csv")
+    parser.add_argument("--output", help="Write to this file instead of stdout")
+
+  def handle(self, *args, **options):
+    filters = {"team": options["team"]}
+    if options["kind"] == "orders":
+      filters["start"] = start_of_day(options["start"]) if options["start"] else None
+      filters["end"] = start_of_day(options["end"] + timedelta(days=1)) if options["end"] else None
+
+    chunks = exports.export(options["kind"], options["format"], **filters)
+    if options["output"]:
+      with open(options["output"], "w", newline="") as f:
+        f.writelines(chunks)
+    else:
+      for chunk in chunks:
+        self.stdout.write(chunk, ending="")
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from shop.images import process_payment_proof, process_product_image
+from shop.models import Payment, Product
+
+
+class Command(BaseCommand):
+  help = "Create the thumbnail and WebP variants of existing product images and payment proofs"
+
+  def add_arguments(self, parser):
+    parser.add_argument("--force", action="store_true", help="Regenerate variants that are already up to date")
+
+  def handle(self, *args, **options):
+    products = sum(
+      process_product_image(product, force=options["force"])
+      for product in Product.objects.exclude(image="").iterator()
+    )
+    payments = sum(
+      process_payment_proof(payment, force=options["force"])
+      for payment in Payment.objects.exclude(proof_picture="").iterator()
+    )
+    self.stdout.write(self.style.SUCCESS(f"Processed {products} product image(s) and {payments} payment proof(s)."))
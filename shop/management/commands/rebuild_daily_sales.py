@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from shop import rollups
+from shop.models import DailyOrderTotals, DailySales
+
+
+class Command(BaseCommand):
+  help = "Recreate the daily sales rollups used by the analytics endpoints"
+
+  def handle(self, *args, **options):
+    rollups.rebuild_daily_sales()
+    self.stdout.write(self.style.SUCCESS(
+      f"Rebuilt {DailySales.objects.count()} daily sales and {DailyOrderTotals.objects.count()} daily order rows."
+    ))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from shop import rollups
+
+
+class Command(BaseCommand):
+  help = "Recompute Product.total_ordered from the order history"
+
+  def handle(self, *args, **options):
+    updated = rollups.rebuild_product_counters()
+    self.stdout.write(self.style.SUCCESS(f"Rebuilt the counters of {updated} product(s)."))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from shop import ledger
+
+
+class Command(BaseCommand):
+  help = "Rebuild the cached team member balances from the balance ledger"
+
+  def add_arguments(self, parser):
+    parser.add_argument("--dry-run", action="store_true", help="Only report members whose balance has drifted")
+
+  def handle(self, *args, **options):
+    drifted = ledger.reconcile(dry_run=options["dry_run"])
+    for member, expected in drifted:
+      self.stdout.write(f"{member.name}: {member.balance} -> {expected}")
+
+    verb = "would be corrected" if options["dry_run"] else "corrected"
+    self.stdout.write(self.style.SUCCESS(f"{len(drifted)} balance(s) {verb}."))
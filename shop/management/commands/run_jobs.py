@@ -0,0 +1,22 @@
+import time
+from django.core.management.base import BaseCommand
+from shop import tasks
+
+
+class Command(BaseCommand):
+  help = "Process queued background jobs"
+
+  def add_arguments(self, parser):
+    parser.add_argument("--once", action="store_true", help="Exit once no job is due instead of polling")
+    parser.add_argument("--sleep", type=float, default=2, help="Seconds to wait between polls when idle")
+
+  def handle(self, *args, **options):
+    while True:
+      tasks.requeue_stale()
+      ran = tasks.run_pending()
+      if ran:
+        self.stdout.write(f"Ran {ran} job(s).")
+      if options["once"]:
+        break
+      if not ran:
+        time.sleep(options["sleep"])
@@ -0,0 +1,66 @@
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_metrics = ContextVar("request_metrics", default=None)
+
+
+class RequestMetrics:
+  """Query, database and serializer timings of a single request.
+
+  Instances double as a ``connection.execute_wrapper`` so every query passes through them.
+  """
+
+  def __init__(self):
+    self.start = time.perf_counter()
+    self.queries = Counter()
+    self.db_time = 0.0
+    self.serialize_time = 0.0
+    self.serialize_depth = 0
+
+  def __call__(self, execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+      return execute(sql, params, many, context)
+    finally:
+      self.db_time += time.perf_counter() - start
+      self.queries[sql] += 1
+
+  @property
+  def query_count(self):
+    return sum(self.queries.values())
+
+  @property
+  def total_time(self):
+    return time.perf_counter() - self.start
+
+  def duplicates(self, threshold):
+    return [(sql, count) for sql, count in self.queries.most_common() if count >= threshold]
+
+
+@contextmanager
+def collect():
+  metrics = RequestMetrics()
+  token = _metrics.set(metrics)
+  try:
+    yield metrics
+  finally:
+    _metrics.reset(token)
+
+
+@contextmanager
+def track_serialization():
+  """Add the time spent serializing, minus the queries it triggered, to the current request."""
+  metrics = _metrics.get()
+  if metrics is None or metrics.serialize_depth:
+    yield
+    return
+
+  metrics.serialize_depth += 1
+  start, db_start = time.perf_counter(), metrics.db_time
+  try:
+    yield
+  finally:
+    metrics.serialize_depth -= 1
+    metrics.serialize_time += (time.perf_counter() - start) - (metrics.db_time - db_start)
@@ -0,0 +1,88 @@
+import json
+import logging
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from . import metrics
+from .pricing import pricing_context
+
+logger = logging.getLogger("shop.requests")
+
+
+class PricingContextMiddleware:
+  """Load the global margin once per request instead of once per product."""
+  sync_capable = True
+  async_capable = True
+
+  def __init__(self, get_response):
+    self.get_response = get_response
+    if iscoroutinefunction(get_response):
+      markcoroutinefunction(self)
+
+  def __call__(self, request):
+    if iscoroutinefunction(self):
+      return self.__acall__(request)
+    with pricing_context():
+      return self.get_response(request)
+
+  async def __acall__(self, request):
+    with pricing_context():
+      return await self.get_response(request)
+
+
+class RequestMetricsMiddleware:
+  """Report query count and timings as Server-Timing headers and log slow requests.
+
+  Enabled with the ``REQUEST_METRICS`` setting; thresholds come from
+  ``SLOW_REQUEST_MS``, ``SLOW_REQUEST_QUERIES`` and ``DUPLICATE_QUERY_THRESHOLD``.
+  """
+
+  def __init__(self, get_response):
+    self.get_response = get_response
+
+  def __call__(self, request):
+    with metrics.collect() as request_metrics, connection.execute_wrapper(request_metrics):
+      response = self.get_response(request)
+
+    total_ms = request_metrics.total_time * 1000
+    response["Server-Timing"] = ", ".join([
+      f'db;desc="{request_metrics.query_count} queries";dur={request_metrics.db_time * 1000:.1f}',
+      f"serialize;dur={request_metrics.serialize_time * 1000:.1f}",
+      f"total;dur={total_ms:.1f}",
+    ])
+    self.log(request, response, request_metrics, total_ms)
+    return response
+
+  def log(self, request, response, request_metrics, total_ms):
+    duplicates = request_metrics.duplicates(settings.DUPLICATE_QUERY_THRESHOLD)
+    slow = total_ms >= settings.SLOW_REQUEST_MS or request_metrics.query_count >= settings.SLOW_REQUEST_QUERIES
+    if not (slow or duplicates):
+      return
+
+    logger.warning(json.dumps({
+      "event": "slow_request" if slow else "duplicate_queries",
+      "view": view_name(request),
+      "method": request.method,
+      "path": request.path,
+      "status": response.status_code,
+      "total_ms": round(total_ms, 1),
+      "db_ms": round(request_metrics.db_time * 1000, 1),
+      "serialize_ms": round(request_metrics.serialize_time * 1000, 1),
+      "queries": request_metrics.query_count,
+      "duplicates": [{"count": count, "sql": sql[:500]} for sql, count in duplicates[:5]],
+    }))
+
+
+def view_name(request):
+  """``ProductViewSet.list`` style name of the view that handled the request."""
+  match = request.resolver_match
+  if match is None:
+    return None
+
+  view_class = getattr(match.func, "cls", None)
+  if view_class is None:
+    # Class-based Django views are named after their class rather than the as_view() closure
+    func = getattr(match.func, "view_class", match.func)
+    return match.view_name or f"{func.__module__}.{func.__qualname__}"
+  actions = getattr(match.func, "actions", None) or {}
+  return f"{view_class.__name__}.{actions.get(request.method.lower(), request.method.lower())}"
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.6 on 2026-10-17 11:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_opening_entries(apps, schema_editor):
+    TeamMember = apps.get_model('shop', 'TeamMember')
+    BalanceEntry = apps.get_model('shop', 'BalanceEntry')
+    BalanceEntry.objects.bulk_create(
+        BalanceEntry(member_id=member_id, kind='opening', amount=balance, description='Balance before the ledger was introduced')
+        for member_id, balance in TeamMember.objects.exclude(balance=0).values_list('id', 'balance')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0010_settings_remove_product_price'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('datetime', models.DateTimeField(auto_now_add=True)),
+                ('kind', models.CharField(choices=[('opening', 'Opening balance'), ('order', 'Order'), ('payment', 'Payment'), ('reversal', 'Reversal'), ('adjustment', 'Adjustment')], max_length=20, verbose_name='Kind')),
+                ('amount', models.DecimalField(decimal_places=2, help_text='Positive for credits, negative for debits', max_digits=10, verbose_name='Amount')),
+                ('description', models.CharField(blank=True, max_length=255, verbose_name='Description')),
+                ('member', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_entries', to='shop.teammember', verbose_name='Member')),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='balance_entries', to='shop.order', verbose_name='Order')),
+                ('payment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='balance_entries', to='shop.payment', verbose_name='Payment')),
+            ],
+            options={
+                'verbose_name': 'Balance entry',
+                'verbose_name_plural': 'Balance entries',
+                'ordering': ['-datetime'],
+            },
+        ),
+        migrations.RunPython(create_opening_entries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-17 11:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0011_balanceentry'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['-datetime', '-id'], name='order_datetime_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['by', '-datetime'], name='order_by_datetime_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['completed', '-id'], name='payment_completed_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['by', '-id'], name='payment_by_id_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-17 11:12
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_total_ordered(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    OrderItem = apps.get_model('shop', 'OrderItem')
+    ordered = (
+        OrderItem.objects.filter(product=OuterRef('pk'))
+        .values('product').annotate(total=Sum('quantity')).values('total')
+    )
+    Product.objects.update(total_ordered=Coalesce(Subquery(ordered), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0012_order_payment_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='total_ordered',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Units sold over all orders', verbose_name='Total ordered'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-total_ordered', 'id'], name='product_total_ordered_idx'),
+        ),
+        migrations.RunPython(fill_total_ordered, migrations.RunPython.noop),
+    ]
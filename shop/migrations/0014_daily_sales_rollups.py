@@ -0,0 +1,77 @@
+# Generated by Django 5.2.6 on 2026-10-17 11:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def fill_rollups(apps, schema_editor):
+    OrderItem = apps.get_model('shop', 'OrderItem')
+    Order = apps.get_model('shop', 'Order')
+    DailySales = apps.get_model('shop', 'DailySales')
+    DailyOrderTotals = apps.get_model('shop', 'DailyOrderTotals')
+
+    sales = (
+        OrderItem.objects.annotate(date=TruncDate('order__datetime'))
+        .values('date', 'product', 'order__by')
+        .annotate(units=Sum('quantity'), revenue=Sum(F('quantity') * F('unit_price'), output_field=models.DecimalField(max_digits=10, decimal_places=2)))
+        .order_by()
+    )
+    DailySales.objects.bulk_create(
+        DailySales(date=row['date'], product_id=row['product'], member_id=row['order__by'], quantity=row['units'], revenue=row['revenue'])
+        for row in sales
+    )
+
+    totals = (
+        Order.objects.annotate(date=TruncDate('datetime'))
+        .values('date', 'by')
+        .annotate(order_count=Count('id'), total=Sum('total_amount'))
+        .order_by()
+    )
+    DailyOrderTotals.objects.bulk_create(
+        DailyOrderTotals(date=row['date'], member_id=row['by'], order_count=row['order_count'], total_amount=row['total'])
+        for row in totals
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0013_product_total_ordered'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyOrderTotals',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Date')),
+                ('order_count', models.IntegerField(default=0, verbose_name='Orders')),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Total amount')),
+                ('member', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_order_totals', to='shop.teammember', verbose_name='Member')),
+            ],
+            options={
+                'verbose_name': 'Daily order totals',
+                'verbose_name_plural': 'Daily order totals',
+                'constraints': [models.UniqueConstraint(fields=('date', 'member'), name='unique_daily_order_totals')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Date')),
+                ('quantity', models.IntegerField(default=0, verbose_name='Quantity')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Revenue')),
+                ('member', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='shop.teammember', verbose_name='Member')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='shop.product', verbose_name='Product')),
+            ],
+            options={
+                'verbose_name': 'Daily sales',
+                'verbose_name_plural': 'Daily sales',
+                'constraints': [models.UniqueConstraint(fields=('date', 'product', 'member'), name='unique_daily_sales')],
+            },
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.6 on 2026-10-17 11:15
+
+from decimal import Decimal, ROUND_HALF_UP
+from django.db import migrations, models
+
+# Frozen copies of shop.pricing at the time of this migration
+DEFAULT_MARGIN = Decimal('10.00')
+
+
+def calculate_price(unit_cost, margin):
+    new_price = unit_cost * (Decimal('1') + (margin / Decimal('100')))
+    return (new_price / Decimal('0.05')).quantize(0, ROUND_HALF_UP) * Decimal('0.05')
+
+
+def fill_prices(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    Settings = apps.get_model('shop', 'Settings')
+    margin = Settings.objects.values_list('margin_percentage', flat=True).first()
+    margin = DEFAULT_MARGIN if margin is None else margin
+
+    products = list(Product.objects.all())
+    for product in products:
+        if product.pack_size == 0:
+            unit_cost = Decimal('0.00')
+        else:
+            unit_cost = (product.cost_ex_btw * (1 + Decimal(product.btw) / 100)) / product.pack_size
+        product.unit_cost = unit_cost.quantize(Decimal('0.0001'))
+        product.sale_price = calculate_price(unit_cost, margin)
+    Product.objects.bulk_update(products, ['unit_cost', 'sale_price'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0014_daily_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='sale_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=7, verbose_name='Sale price'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='unit_cost',
+            field=models.DecimalField(decimal_places=4, default=0, editable=False, max_digits=9, verbose_name='Unit cost (incl. BTW)'),
+        ),
+        migrations.RunPython(fill_prices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-17 11:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0015_product_price_columns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='proof_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Proof picture variants'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Image variants'),
+        ),
+    ]
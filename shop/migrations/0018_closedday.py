@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-17 11:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0017_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClosedDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True, verbose_name='Date')),
+                ('reason', models.CharField(blank=True, max_length=100, verbose_name='Reason')),
+            ],
+            options={
+                'verbose_name': 'Closed day',
+                'verbose_name_plural': 'Closed days',
+                'ordering': ['date'],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-17 11:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0018_closedday'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['product', 'quantity', 'unit_price'], name='orderitem_product_sales_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-17 11:30
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0019_orderitem_product_sales_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(help_text='The endpoint the key was used on', max_length=50, verbose_name='Scope')),
+                ('key', models.CharField(max_length=255, verbose_name='Key')),
+                ('fingerprint', models.CharField(max_length=64, verbose_name='Request fingerprint')),
+                ('status_code', models.PositiveSmallIntegerField(verbose_name='Status code')),
+                ('response', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='Response')),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Created')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='idempotency_keys', to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Idempotency key',
+                'verbose_name_plural': 'Idempotency keys',
+                'constraints': [models.UniqueConstraint(fields=('user', 'scope', 'key'), name='unique_idempotency_key')],
+            },
+        ),
+    ]
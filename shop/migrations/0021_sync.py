@@ -0,0 +1,46 @@
+# Generated by Django 5.2.6 on 2026-10-17 11:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0020_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(choices=[('product', 'Product'), ('category', 'Category'), ('team_member', 'Team member')], max_length=20, verbose_name='Model')),
+                ('object_id', models.PositiveBigIntegerField(verbose_name='Object id')),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Deleted at')),
+            ],
+            options={
+                'verbose_name': 'Tombstone',
+                'verbose_name_plural': 'Tombstones',
+            },
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Updated at'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Updated at'),
+        ),
+        migrations.AddField(
+            model_name='settings',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Updated at'),
+        ),
+        migrations.AddField(
+            model_name='teammember',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Updated at'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-17 12:05
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_btw(apps, schema_editor):
+    # Earlier order lines did not record their rate, the product's current rate is the best guess
+    OrderItem = apps.get_model('shop', 'OrderItem')
+    Product = apps.get_model('shop', 'Product')
+    OrderItem.objects.update(btw=Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('btw')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0021_sync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='btw',
+            field=models.PositiveSmallIntegerField(choices=[(9, '9%'), (0, '0%'), (21, '21%')], editable=False, help_text='Rate of the product when it was sold', null=True, verbose_name='BTW-%'),
+        ),
+        migrations.RunPython(fill_btw, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='btw',
+            field=models.PositiveSmallIntegerField(choices=[(9, '9%'), (0, '0%'), (21, '21%')], editable=False, help_text='Rate of the product when it was sold', verbose_name='BTW-%'),
+        ),
+    ]
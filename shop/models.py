@@ -1,7 +1,11 @@
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.db.models import Sum, F
 from django.core.validators import MinValueValidator
-from decimal import Decimal, ROUND_HALF_UP
+from django.utils.timezone import now
+from decimal import Decimal
+from .pricing import calculate_price, get_margin
 
 BACO_MARGIN = 1.1 # Margin to go on products: 1.1 = 10%
 
@@ -11,6 +15,9 @@ BTW_CHOICES = [
   (21, "21%")
 ]
 
+# Fields the stored unit_cost and sale_price of a product are derived from
+PRICE_INPUT_FIELDS = {"cost_ex_btw", "pack_size", "btw"}
+
 class Team(models.Model):
   number = models.PositiveIntegerField('Number', unique=True)
   start_date = models.DateField('Start date')
@@ -25,11 +32,37 @@ class Team(models.Model):
     get_latest_by = "start_date"
 
 
+class ClosedDay(models.Model):
+  date = models.DateField('Date', unique=True)
+  reason = models.CharField('Reason', max_length=100, blank=True)
+
+  def __str__(self):
+    return f"{self.date:%d/%m/%y} {self.reason}".strip()
+
+  class Meta:
+    verbose_name = "Closed day"
+    verbose_name_plural = "Closed days"
+    ordering = ['date']
+
+
 class TeamMember(models.Model):
   name = models.CharField('Name', max_length=50)
   email = models.EmailField('Email')
   team = models.ForeignKey(Team, verbose_name='Team', related_name='team_members', on_delete=models.RESTRICT)
   balance = models.DecimalField('Balance', max_digits=10, decimal_places=2, default=0)
+  updated_at = models.DateTimeField('Updated at', auto_now=True, db_index=True)
+
+  def save(self, *args, **kwargs):
+    # The balance only moves through the F() updates of shop.ledger. Saving an existing member,
+    # e.g. from the admin, must not write back the balance it was loaded with over a ledger
+    # update that committed in between. Name "balance" in update_fields to write it anyway
+    if not self._state.adding and kwargs.get("update_fields") is None:
+      deferred = self.get_deferred_fields()
+      kwargs["update_fields"] = [
+        field.name for field in self._meta.concrete_fields
+        if not field.primary_key and field.name != "balance" and field.attname not in deferred
+      ]
+    super().save(*args, **kwargs)
 
   def __str__(self):
     return self.name
@@ -46,6 +79,7 @@ class Category(models.Model):
   name = models.CharField('Name', unique=True, max_length=50)
   icon = models.CharField('Icon', max_length=20)
   visible = models.BooleanField('Visible', default=True)
+  updated_at = models.DateTimeField('Updated at', auto_now=True, db_index=True)
 
   def __str__(self):
     return self.name
@@ -58,6 +92,7 @@ class Category(models.Model):
 class Product(models.Model):
   name = models.CharField('Name', max_length=100)
   image = models.ImageField('Image', upload_to='product_images')
+  image_variants = models.JSONField('Image variants', default=dict, blank=True, editable=False)
   description = models.TextField('Description', max_length=255, blank=True)
   category = models.ForeignKey(Category, verbose_name='Category', on_delete=models.RESTRICT)
   visible = models.BooleanField('Visible', default=True)
@@ -65,6 +100,10 @@ class Product(models.Model):
   cost_ex_btw = models.DecimalField('Cost Price (ex. BTW)', max_digits=5, decimal_places=2, default=0, help_text='Total cost for full package, excluding BTW')
   pack_size = models.PositiveIntegerField('Pack Size', default=24, help_text='Number of units in the package')
   btw = models.PositiveSmallIntegerField('BTW-%', choices=BTW_CHOICES, default=9)
+  unit_cost = models.DecimalField('Unit cost (incl. BTW)', max_digits=9, decimal_places=4, default=0, editable=False)
+  sale_price = models.DecimalField('Sale price', max_digits=7, decimal_places=2, default=0, editable=False)
+  total_ordered = models.PositiveIntegerField('Total ordered', default=0, editable=False, help_text='Units sold over all orders')
+  updated_at = models.DateTimeField('Updated at', auto_now=True, db_index=True)
 
   def calculate_unit_cost(self):
     if self.pack_size == 0:
@@ -73,13 +112,43 @@ class Product(models.Model):
     btw_multiplier = Decimal("1") + (Decimal(self.btw) / Decimal("100"))
     return (self.cost_ex_btw * btw_multiplier) / Decimal(self.pack_size)
   
+  def calculate_price(self, margin=None):
+    if margin is None:
+      margin = get_margin()
+    return calculate_price(self.calculate_unit_cost(), margin)
+
+  def update_prices(self, margin=None):
+    """Refresh the stored price columns, returning whether any of them changed."""
+    unit_cost = self.calculate_unit_cost().quantize(Decimal("0.0001"))
+    sale_price = self.calculate_price(margin)
+    changed = (unit_cost, sale_price) != (self.unit_cost, self.sale_price)
+    self.unit_cost, self.sale_price = unit_cost, sale_price
+    return changed
+
   @property
   def price(self):
-    margin = Settings.objects.first().margin_percentage
-    unit_cost = self.calculate_unit_cost()
-    new_price = unit_cost * (Decimal("1") + (margin / Decimal("100")))
-    rounded = (new_price / Decimal("0.05")).quantize(0, ROUND_HALF_UP) * Decimal("0.05")
-    return rounded
+    return self.sale_price
+
+  @classmethod
+  def from_db(cls, db, field_names, values):
+    instance = super().from_db(db, field_names, values)
+    instance._saved_price_inputs = instance.price_inputs()
+    return instance
+
+  def price_inputs(self):
+    # Read from __dict__ so deferred fields are not loaded just for this comparison
+    return {name: self.__dict__.get(name) for name in PRICE_INPUT_FIELDS}
+
+  def save(self, *args, **kwargs):
+    # Margin changes reprice every product at once, so the stored prices only go
+    # stale when the product's own inputs change. Other edits skip the margin lookup
+    if self._state.adding or self.price_inputs() != getattr(self, "_saved_price_inputs", None):
+      self.update_prices()
+      update_fields = kwargs.get("update_fields")
+      if update_fields is not None and PRICE_INPUT_FIELDS.intersection(update_fields):
+        kwargs["update_fields"] = {*update_fields, "unit_cost", "sale_price"}
+    super().save(*args, **kwargs)
+    self._saved_price_inputs = self.price_inputs()
 
   def __str__(self):
     return self.name
@@ -87,7 +156,9 @@ class Product(models.Model):
   class Meta:
     verbose_name = "Product"
     verbose_name_plural = "Products"
-    # ordering = by most frequently bought?
+    indexes = [
+      models.Index(fields=["-total_ordered", "id"], name="product_total_ordered_idx"),
+    ]
 
 
 class Order(models.Model):
@@ -103,7 +174,7 @@ class Order(models.Model):
   def save(self, *args, **kwargs):
     if self.pk:
       self.total_amount = self.calculate_total()
-    else:
+    elif self.total_amount is None:
       self.total_amount = 0 # Should be temporary if all goes well
     super().save(*args, **kwargs)
   
@@ -115,6 +186,10 @@ class Order(models.Model):
     verbose_name_plural = "Orders"
     ordering = ['-datetime']
     get_latest_by = "datetime"
+    indexes = [
+      models.Index(fields=["-datetime", "-id"], name="order_datetime_id_idx"),
+      models.Index(fields=["by", "-datetime"], name="order_by_datetime_idx"),
+    ]
 
 
 class OrderItem(models.Model):
@@ -122,10 +197,13 @@ class OrderItem(models.Model):
   order = models.ForeignKey(Order, verbose_name='Order', related_name='items', on_delete=models.CASCADE)
   quantity = models.PositiveIntegerField('Quantity', validators=[MinValueValidator(1)])
   unit_price = models.DecimalField('Unit price', max_digits=5, decimal_places=2)
+  btw = models.PositiveSmallIntegerField('BTW-%', choices=BTW_CHOICES, editable=False, help_text='Rate of the product when it was sold')
 
   def save(self, *args, **kwargs):
     if not self.unit_price:
       self.unit_price = self.product.price
+    if self.btw is None:
+      self.btw = self.product.btw
     super().save(*args, **kwargs)
 
   def __str__(self):
@@ -137,6 +215,17 @@ class OrderItem(models.Model):
     constraints = [
       models.UniqueConstraint(fields=["product", "order"], name="unique_product_per_order")
     ]
+    indexes = [
+      # Covers the per-product quantity and revenue sums without reading the table
+      models.Index(fields=["product", "quantity", "unit_price"], name="orderitem_product_sales_idx"),
+    ]
+
+
+class PaymentQuerySet(models.QuerySet):
+  def completed(self, completed=True):
+    # An IN lookup compiles to "completed IN (...)" rather than a bare "NOT completed",
+    # which SQLite cannot match against payment_completed_id_idx
+    return self.filter(completed__in=[completed])
 
 
 class Payment(models.Model):
@@ -144,8 +233,11 @@ class Payment(models.Model):
   description = models.TextField('Description', blank=True)
   amount = models.DecimalField('Amount', max_digits=5, decimal_places=2)
   proof_picture = models.ImageField('Proof picture', upload_to="payment_proofs", blank=True)
+  proof_variants = models.JSONField('Proof picture variants', default=dict, blank=True, editable=False)
   completed = models.BooleanField('Completed', default=False)
 
+  objects = PaymentQuerySet.as_manager()
+
   def __str__(self):
     return f"Request by {self.by.name} - {self.amount} ({'Completed' if self.completed else 'Pending'})"
   
@@ -153,10 +245,161 @@ class Payment(models.Model):
     verbose_name = "Payment"
     verbose_name_plural = "Payments"
     ordering = ['completed']
+    indexes = [
+      models.Index(fields=["completed", "-id"], name="payment_completed_id_idx"),
+      models.Index(fields=["by", "-id"], name="payment_by_id_idx"),
+    ]
+
+
+class DailySales(models.Model):
+  date = models.DateField('Date')
+  product = models.ForeignKey(Product, verbose_name='Product', related_name='daily_sales', on_delete=models.CASCADE)
+  member = models.ForeignKey(TeamMember, verbose_name='Member', related_name='daily_sales', on_delete=models.CASCADE)
+  quantity = models.IntegerField('Quantity', default=0)
+  revenue = models.DecimalField('Revenue', max_digits=10, decimal_places=2, default=0)
+
+  def __str__(self):
+    return f"{self.date}: {self.quantity}x {self.product_id} by {self.member_id}"
+
+  class Meta:
+    verbose_name = "Daily sales"
+    verbose_name_plural = "Daily sales"
+    constraints = [
+      models.UniqueConstraint(fields=["date", "product", "member"], name="unique_daily_sales")
+    ]
+
+
+class DailyOrderTotals(models.Model):
+  date = models.DateField('Date')
+  member = models.ForeignKey(TeamMember, verbose_name='Member', related_name='daily_order_totals', on_delete=models.CASCADE)
+  order_count = models.IntegerField('Orders', default=0)
+  total_amount = models.DecimalField('Total amount', max_digits=10, decimal_places=2, default=0)
+
+  def __str__(self):
+    return f"{self.date}: {self.order_count} orders by {self.member_id}"
+
+  class Meta:
+    verbose_name = "Daily order totals"
+    verbose_name_plural = "Daily order totals"
+    constraints = [
+      models.UniqueConstraint(fields=["date", "member"], name="unique_daily_order_totals")
+    ]
+
+
+class BalanceEntry(models.Model):
+  OPENING = "opening"
+  ORDER = "order"
+  PAYMENT = "payment"
+  REVERSAL = "reversal"
+  ADJUSTMENT = "adjustment"
+  KIND_CHOICES = [
+    (OPENING, "Opening balance"),
+    (ORDER, "Order"),
+    (PAYMENT, "Payment"),
+    (REVERSAL, "Reversal"),
+    (ADJUSTMENT, "Adjustment"),
+  ]
+
+  member = models.ForeignKey(TeamMember, verbose_name='Member', related_name='balance_entries', on_delete=models.CASCADE)
+  datetime = models.DateTimeField(auto_now_add=True, editable=False)
+  kind = models.CharField('Kind', max_length=20, choices=KIND_CHOICES)
+  amount = models.DecimalField('Amount', max_digits=10, decimal_places=2, help_text='Positive for credits, negative for debits')
+  order = models.ForeignKey(Order, verbose_name='Order', related_name='balance_entries', null=True, blank=True, on_delete=models.SET_NULL)
+  payment = models.ForeignKey(Payment, verbose_name='Payment', related_name='balance_entries', null=True, blank=True, on_delete=models.SET_NULL)
+  description = models.CharField('Description', max_length=255, blank=True)
+
+  def __str__(self):
+    return f"{self.get_kind_display()} {self.amount:+} for {self.member.name}"
+
+  class Meta:
+    verbose_name = "Balance entry"
+    verbose_name_plural = "Balance entries"
+    ordering = ['-datetime']
+
+
+class Job(models.Model):
+  PENDING = "pending"
+  RUNNING = "running"
+  DONE = "done"
+  FAILED = "failed"
+  STATUS_CHOICES = [
+    (PENDING, "Pending"),
+    (RUNNING, "Running"),
+    (DONE, "Done"),
+    (FAILED, "Failed"),
+  ]
+
+  name = models.CharField('Task', max_length=100)
+  payload = models.JSONField('Payload', default=dict, blank=True)
+  idempotency_key = models.CharField('Idempotency key', max_length=255, unique=True, null=True, blank=True)
+  status = models.CharField('Status', max_length=10, choices=STATUS_CHOICES, default=PENDING)
+  attempts = models.PositiveSmallIntegerField('Attempts', default=0)
+  max_attempts = models.PositiveSmallIntegerField('Max attempts', default=3)
+  run_at = models.DateTimeField('Run at', default=now)
+  created = models.DateTimeField('Created', auto_now_add=True)
+  started = models.DateTimeField('Started', null=True, blank=True)
+  finished = models.DateTimeField('Finished', null=True, blank=True)
+  last_error = models.TextField('Last error', blank=True)
+
+  def __str__(self):
+    return f"{self.name} #{self.pk} ({self.get_status_display()})"
+
+  class Meta:
+    verbose_name = "Job"
+    verbose_name_plural = "Jobs"
+    ordering = ['-created']
+    indexes = [
+      models.Index(fields=["status", "run_at"], name="job_status_run_at_idx"),
+    ]
+
+
+class Tombstone(models.Model):
+  """Marks a synced row as deleted, so tablets can drop it on their next incremental sync."""
+  PRODUCT = "product"
+  CATEGORY = "category"
+  TEAM_MEMBER = "team_member"
+  MODEL_CHOICES = [
+    (PRODUCT, "Product"),
+    (CATEGORY, "Category"),
+    (TEAM_MEMBER, "Team member"),
+  ]
+
+  model = models.CharField('Model', max_length=20, choices=MODEL_CHOICES)
+  object_id = models.PositiveBigIntegerField('Object id')
+  deleted_at = models.DateTimeField('Deleted at', auto_now_add=True, db_index=True)
+
+  def __str__(self):
+    return f"{self.get_model_display()} {self.object_id} deleted"
+
+  class Meta:
+    verbose_name = "Tombstone"
+    verbose_name_plural = "Tombstones"
+
+
+class IdempotencyKey(models.Model):
+  """A client-supplied Idempotency-Key of a create request, with the response it produced."""
+  user = models.ForeignKey(settings.AUTH_USER_MODEL, verbose_name='User', related_name='idempotency_keys', on_delete=models.CASCADE)
+  scope = models.CharField('Scope', max_length=50, help_text='The endpoint the key was used on')
+  key = models.CharField('Key', max_length=255)
+  fingerprint = models.CharField('Request fingerprint', max_length=64)
+  status_code = models.PositiveSmallIntegerField('Status code')
+  response = models.JSONField('Response', encoder=DjangoJSONEncoder)
+  created = models.DateTimeField('Created', auto_now_add=True, db_index=True)
+
+  def __str__(self):
+    return f"{self.scope} {self.key}"
+
+  class Meta:
+    verbose_name = "Idempotency key"
+    verbose_name_plural = "Idempotency keys"
+    constraints = [
+      models.UniqueConstraint(fields=["user", "scope", "key"], name="unique_idempotency_key")
+    ]
 
 
 class Settings(models.Model):
   margin_percentage = models.DecimalField('Margin (%)', max_digits=5, decimal_places=2, default=10.00, help_text='This margin applies to all products')
+  updated_at = models.DateTimeField('Updated at', auto_now=True, db_index=True)
 
   def __str__(self):
     return f"Global settings (margin {self.margin_percentage}%)"
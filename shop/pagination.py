@@ -0,0 +1,15 @@
+from rest_framework.pagination import CursorPagination
+
+
+class OrderCursorPagination(CursorPagination):
+  page_size = 50
+  page_size_query_param = "page_size"
+  max_page_size = 500
+  ordering = ("-datetime", "-id")
+
+
+class PaymentCursorPagination(CursorPagination):
+  page_size = 50
+  page_size_query_param = "page_size"
+  max_page_size = 500
+  ordering = ("-id",)
@@ -0,0 +1,67 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from decimal import Decimal, ROUND_HALF_UP
+from django.utils.timezone import now
+
+DEFAULT_MARGIN = Decimal("10.00")
+
+_context = ContextVar("pricing_context", default=None)
+
+
+def load_margin():
+  from .models import Settings
+
+  margin = Settings.objects.values_list("margin_percentage", flat=True).first()
+  return DEFAULT_MARGIN if margin is None else margin
+
+
+def get_margin():
+  """Margin percentage, read at most once per active pricing context."""
+  context = _context.get()
+  if context is None:
+    return load_margin()
+  if "margin" not in context:
+    context["margin"] = load_margin()
+  return context["margin"]
+
+
+def set_margin(margin):
+  """Update the margin of the active context, e.g. after the settings were saved."""
+  context = _context.get()
+  if context is not None:
+    context["margin"] = margin
+
+
+@contextmanager
+def pricing_context():
+  """Share one margin lookup between every price computed inside the block."""
+  if _context.get() is not None:
+    yield
+    return
+
+  token = _context.set({})
+  try:
+    yield
+  finally:
+    _context.reset(token)
+
+
+def calculate_price(unit_cost, margin):
+  new_price = unit_cost * (Decimal("1") + (margin / Decimal("100")))
+  return (new_price / Decimal("0.05")).quantize(0, ROUND_HALF_UP) * Decimal("0.05")
+
+
+def reprice_products(margin):
+  """Recompute the stored prices of every product for a new margin in one bulk update."""
+  from .models import Product
+
+  products = [
+    product for product in Product.objects.only("cost_ex_btw", "pack_size", "btw", "unit_cost", "sale_price")
+    if product.update_prices(margin)
+  ]
+  # bulk_update skips auto_now, the sync endpoint relies on updated_at moving
+  updated_at = now()
+  for product in products:
+    product.updated_at = updated_at
+  Product.objects.bulk_update(products, ["unit_cost", "sale_price", "updated_at"], batch_size=500)
+  return len(products)
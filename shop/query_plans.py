@@ -0,0 +1,89 @@
+"""EXPLAIN the querysets behind the busiest endpoints and flag the ones that scan a whole table.
+
+Run through ``manage.py explain_queries`` against SQLite or PostgreSQL after changing a
+queryset or an index, ideally on a database holding a realistic amount of data.
+"""
+import re
+from datetime import timedelta
+from django.db import connection
+from django.db.models import Sum
+from django.utils.timezone import localdate
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from . import analytics, exports
+from .models import OrderItem, Team, TeamMember
+from .urls import router
+
+# Full table scans and sorts that cannot use an index, per database vendor
+FULL_SCAN_PATTERNS = {
+  "sqlite": re.compile(r"\bSCAN (?!.*\bUSING\b.*INDEX)|USE TEMP B-TREE FOR ORDER BY"),
+  "postgresql": re.compile(r"\bSeq Scan on\b"),
+}
+SORT_PATTERNS = {
+  "sqlite": re.compile(r"USE TEMP B-TREE FOR ORDER BY"),
+  "postgresql": re.compile(r"\bSort\b"),
+}
+
+
+def list_queryset(viewset, params):
+  """The queryset the list action of ``viewset`` evaluates for a request with ``params``."""
+  view = viewset(action="list", format_kwarg=None, args=(), kwargs={})
+  view.request = Request(APIRequestFactory().get("/", params))
+  queryset = view.filter_queryset(view.get_queryset())
+
+  paginator = view.paginator
+  if paginator is not None:
+    ordering = getattr(paginator, "ordering", None)
+    if ordering:
+      queryset = queryset.order_by(*([ordering] if isinstance(ordering, str) else ordering))
+    queryset = queryset[:paginator.page_size]
+  return queryset
+
+
+def audited_querysets():
+  """``(name, queryset)`` for every list endpoint, its filters and the analytics queries."""
+  member = TeamMember.objects.values_list("pk", flat=True).first() or 1
+  team = Team.objects.values_list("pk", flat=True).first() or 1
+  week_ago = (localdate() - timedelta(days=7)).isoformat()
+  filters = {
+    "order": [{"by": member}, {"start": week_ago}],
+    "payment": [{"by": member}, {"completed": "false"}],
+  }
+
+  for _, viewset, basename in router.registry:
+    if not hasattr(viewset, "list") or not hasattr(viewset, "get_queryset"):
+      continue
+    yield f"{basename}-list", list_queryset(viewset, {})
+    for params in filters.get(basename, []):
+      yield f"{basename}-list?{'&'.join(params)}", list_queryset(viewset, params)
+
+  start_date = localdate() - timedelta(days=30)
+  yield "analytics-top-products", analytics.top_products_query()
+  yield "analytics-top-users", analytics.top_users_query()
+  yield "analytics-summary?user_id", analytics.summary_query(member)
+  yield "analytics-sales-over-time", analytics.sales_over_time_query(start_date)
+  yield "analytics-member-totals", analytics.member_totals_query()
+  yield "export-orders", exports.order_item_queryset(team=team)
+  yield "product-counters", OrderItem.objects.values("product").annotate(total=Sum("quantity")).order_by()
+
+
+def full_scans(plan, vendor=None, limited=False):
+  """Lines of an EXPLAIN ``plan`` that read a whole table or sort without an index.
+
+  A ``limited`` query that scans in primary key order without sorting stops after
+  its page, so its scan is only reported when the plan also sorts.
+  """
+  vendor = vendor or connection.vendor
+  pattern = FULL_SCAN_PATTERNS.get(vendor)
+  if pattern is None:
+    return []
+  if limited and not SORT_PATTERNS[vendor].search(plan):
+    return []
+  return [line.strip() for line in plan.splitlines() if pattern.search(line)]
+
+
+def audit():
+  """``(name, plan, full_scans)`` for each audited queryset on the default database."""
+  for name, queryset in audited_querysets():
+    plan = queryset.explain()
+    yield name, plan, full_scans(plan, limited=queryset.query.is_sliced)
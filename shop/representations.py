@@ -0,0 +1,145 @@
+"""Plain dict representations for the busiest list endpoints, built from ``.values()`` rows.
+
+ProductSerializer and OrderSerializer run DRF's field machinery for every field of every
+row, which dominates the CPU time of large lists. These build the same JSON directly,
+sharing one dict per category and product across rows. Creates and detail views keep
+using the serializers. The expected keys are read from the serializers, so a field
+added there but not here makes the lists fail instead of silently leaving it out.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import default_storage
+from rest_framework import serializers
+from rest_framework.response import Response
+from .metrics import track_serialization
+from .models import Product, OrderItem
+from .serializers import (
+  CategorySerializer, OrderItemSerializer, OrderSerializer, ProductSerializer, query_param_list, variant_urls,
+)
+
+PRODUCT_VALUES = (
+  "id", "name", "image", "image_variants", "description", "sale_price", "unit_cost", "visible",
+  "category_id", "category__name", "category__icon", "category__visible", "category__updated_at",
+)
+ORDER_VALUES = ("id", "datetime", "by", "total_amount")
+
+# Unbound fields of the same type as the serializers use, only for their to_representation
+DATETIME = serializers.DateTimeField()
+TOTAL_AMOUNT = serializers.DecimalField(max_digits=10, decimal_places=2)
+UNIT_PRICE = serializers.DecimalField(max_digits=5, decimal_places=2)
+
+
+def readable_fields(serializer_class):
+  return tuple(name for name, field in serializer_class().fields.items() if not field.write_only)
+
+
+PRODUCT_FIELDS = readable_fields(ProductSerializer)
+CATEGORY_FIELDS = readable_fields(CategorySerializer)
+ORDER_FIELDS = readable_fields(OrderSerializer)
+ORDER_ITEM_FIELDS = readable_fields(OrderItemSerializer)
+
+
+def check_fields(representation, fields, serializer_class):
+  """Raise when ``representation`` does not have the fields of ``serializer_class``, in its order."""
+  if tuple(representation) != fields:
+    raise ImproperlyConfigured(
+      f"{serializer_class.__name__} renders {fields}, its lean representation {tuple(representation)}."
+    )
+
+
+def file_url(name, request):
+  if not name:
+    return None
+  url = default_storage.url(name)
+  return request.build_absolute_uri(url) if request else url
+
+
+def products(rows, request=None, categories=None):
+  """ProductSerializer output for ``rows`` of ``PRODUCT_VALUES``."""
+  categories = {} if categories is None else categories
+  result = []
+  for row in rows:
+    category = categories.get(row["category_id"])
+    if category is None:
+      category = categories[row["category_id"]] = {
+        "id": row["category_id"],
+        "name": row["category__name"],
+        "icon": row["category__icon"],
+        "visible": row["category__visible"],
+        "updated_at": DATETIME.to_representation(row["category__updated_at"]),
+      }
+      check_fields(category, CATEGORY_FIELDS, CategorySerializer)
+    result.append({
+      "id": row["id"],
+      "name": row["name"],
+      "image": file_url(row["image"], request),
+      "image_variants": variant_urls(row["image_variants"], request),
+      "description": row["description"],
+      "price": round(float(row["sale_price"]), 2),
+      "unit_cost": round(float(row["unit_cost"]), 2),
+      "category": category,
+      "visible": row["visible"],
+    })
+  if result:
+    check_fields(result[0], PRODUCT_FIELDS, ProductSerializer)
+  return result
+
+
+def orders(rows, request=None):
+  """OrderSerializer output for ``rows`` of ``ORDER_VALUES``, honouring ``?fields=`` and ``?expand=``."""
+  context = {"request": request}
+  fields = query_param_list(context, "fields")
+  fields = ORDER_FIELDS if fields is None else [name for name in ORDER_FIELDS if name in fields]
+  expand = query_param_list(context, "expand")
+  expand_product = expand is None or "product" in expand
+
+  items = {row["id"]: [] for row in rows}
+  if "items" in fields and items:
+    item_rows = list(
+      OrderItem.objects.filter(order_id__in=items).order_by("id")
+      .values("id", "order_id", "product_id", "unit_price", "quantity")
+    )
+    product_ids = {item["product_id"] for item in item_rows}
+    if expand_product and product_ids:
+      rows_by_id = Product.objects.filter(pk__in=product_ids).values(*PRODUCT_VALUES)
+      product_by_id = {product["id"]: product for product in products(rows_by_id, request)}
+    else:
+      product_by_id = {pk: pk for pk in product_ids}
+    for item in item_rows:
+      items[item["order_id"]].append({
+        "id": item["id"],
+        "product": product_by_id[item["product_id"]],
+        "unit_price": UNIT_PRICE.to_representation(item["unit_price"]),
+        "quantity": item["quantity"],
+      })
+    if item_rows:
+      check_fields(items[item_rows[0]["order_id"]][0], ORDER_ITEM_FIELDS, OrderItemSerializer)
+
+  result = []
+  for row in rows:
+    order = {
+      "id": row["id"],
+      "datetime": DATETIME.to_representation(row["datetime"]),
+      "by": row["by"],
+      "items": items[row["id"]],
+      "total_amount": TOTAL_AMOUNT.to_representation(row["total_amount"]),
+    }
+    if not result:
+      check_fields(order, ORDER_FIELDS, OrderSerializer)
+    result.append({name: order[name] for name in fields})
+  return result
+
+
+class ValuesListMixin:
+  """List action that renders ``.values(*list_values)`` rows with ``list_representation(rows, request)``.
+
+  Both are class attributes of the viewset, e.g. ``staticmethod(representations.products)``.
+  """
+
+  def list(self, request, *args, **kwargs):
+    rows = self.filter_queryset(self.get_queryset()).prefetch_related(None).values(*self.list_values)
+    page = self.paginate_queryset(rows)
+    with track_serialization():
+      data = self.list_representation(rows if page is None else page, request)
+    if page is None:
+      return Response(data)
+    return self.get_paginated_response(data)
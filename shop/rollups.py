@@ -0,0 +1,124 @@
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils.timezone import localdate
+from .models import DailyOrderTotals, DailySales, Order, OrderItem, Product
+
+
+def per_key(values, output_field):
+  """CASE expression picking the value for the row's product from ``{product_id: value}``."""
+  return Case(
+    *(When(product_id=pk, then=Value(value)) for pk, value in values.items()),
+    default=Value(0), output_field=output_field,
+  )
+
+
+def add_product_sales(quantities):
+  """Add ``{product_id: quantity}`` to the product counters with a single UPDATE."""
+  quantities = {pk: quantity for pk, quantity in quantities.items() if quantity}
+  if not quantities:
+    return
+  delta = Case(
+    *(When(pk=pk, then=Value(quantity)) for pk, quantity in quantities.items()),
+    default=Value(0), output_field=IntegerField(),
+  )
+  Product.objects.filter(pk__in=quantities).update(total_ordered=F("total_ordered") + delta)
+
+
+def add_daily_sales(day, member_id, sales, create=True):
+  """Add ``{product_id: (quantity, revenue)}`` to the member's rollup rows of one day.
+
+  Deletions pass ``create=False``: the rows they subtract from already exist, and
+  the product or member being deleted must not get new rows halfway through the cascade.
+  """
+  sales = {pk: values for pk, values in sales.items() if any(values)}
+  if not sales:
+    return
+  if create:
+    DailySales.objects.bulk_create(
+      [DailySales(date=day, product_id=pk, member_id=member_id) for pk in sales],
+      ignore_conflicts=True,
+    )
+  DailySales.objects.filter(date=day, member_id=member_id, product_id__in=sales).update(
+    quantity=F("quantity") + per_key({pk: quantity for pk, (quantity, _) in sales.items()}, IntegerField()),
+    revenue=F("revenue") + per_key({pk: revenue for pk, (_, revenue) in sales.items()}, DecimalField(max_digits=10, decimal_places=2)),
+  )
+
+
+def add_daily_orders(day, member_id, order_count, total_amount, create=True):
+  if create:
+    DailyOrderTotals.objects.bulk_create(
+      [DailyOrderTotals(date=day, member_id=member_id)], ignore_conflicts=True,
+    )
+  DailyOrderTotals.objects.filter(date=day, member_id=member_id).update(
+    order_count=F("order_count") + order_count,
+    total_amount=F("total_amount") + total_amount,
+  )
+
+
+def record_order(order, items):
+  """Roll a freshly created order and its items up in a constant number of queries."""
+  day = localdate(order.datetime)
+  add_product_sales({item.product_id: item.quantity for item in items})
+  add_daily_sales(day, order.by_id, {
+    item.product_id: (item.quantity, item.quantity * item.unit_price) for item in items
+  })
+  add_daily_orders(day, order.by_id, 1, order.total_amount)
+
+
+def record_item_change(item, quantity, revenue, create=True):
+  """Apply a quantity and revenue difference of a single order item to every rollup."""
+  order = item.order
+  day = localdate(order.datetime)
+  add_product_sales({item.product_id: quantity})
+  add_daily_sales(day, order.by_id, {item.product_id: (quantity, revenue)}, create=create)
+  if revenue:
+    add_daily_orders(day, order.by_id, 0, revenue, create=create)
+
+
+def rebuild_product_counters():
+  ordered = (
+    OrderItem.objects.filter(product=OuterRef("pk"))
+    .values("product").annotate(total=Sum("quantity")).values("total")
+  )
+  return Product.objects.update(total_ordered=Coalesce(Subquery(ordered), Value(0)))
+
+
+@transaction.atomic
+def rebuild_daily_sales():
+  """Recreate both daily rollup tables from the full order history."""
+  DailySales.objects.all().delete()
+  DailyOrderTotals.objects.all().delete()
+
+  sales = (
+    OrderItem.objects
+    .annotate(date=TruncDate("order__datetime"))
+    .values("date", "product", "order__by")
+    .annotate(
+      units=Sum("quantity"),
+      revenue=Sum(F("quantity") * F("unit_price"), output_field=DecimalField(max_digits=10, decimal_places=2)),
+    )
+    .order_by()
+  )
+  DailySales.objects.bulk_create(
+    (
+      DailySales(date=row["date"], product_id=row["product"], member_id=row["order__by"], quantity=row["units"], revenue=row["revenue"])
+      for row in sales.iterator()
+    ),
+    batch_size=500,
+  )
+
+  totals = (
+    Order.objects
+    .annotate(date=TruncDate("datetime"))
+    .values("date", "by")
+    .annotate(order_count=Count("id"), total=Sum("total_amount"))
+    .order_by()
+  )
+  DailyOrderTotals.objects.bulk_create(
+    (
+      DailyOrderTotals(date=row["date"], member_id=row["by"], order_count=row["order_count"], total_amount=row["total"])
+      for row in totals.iterator()
+    ),
+    batch_size=500,
+  )
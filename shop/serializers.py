@@ -1,10 +1,46 @@
+from decimal import Decimal
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import prefetch_related_objects
 from rest_framework import serializers
-from .models import Payment, Team, TeamMember, Category, Product, Order, OrderItem
+from rest_framework.permissions import SAFE_METHODS
+from . import ledger, rollups
+from .metrics import track_serialization
+from .models import BalanceEntry, Payment, Team, TeamMember, Category, Product, Order, OrderItem
+
+
+def query_param_list(context, name):
+  """Comma separated query parameter as a list, or None when it was not given."""
+  request = context.get("request")
+  if request is None or name not in request.query_params:
+    return None
+  return [value for value in request.query_params[name].split(",") if value]
+
+
+class TimedListSerializer(serializers.ListSerializer):
+  """Reports its serialization time to the request metrics middleware."""
+
+  def to_representation(self, data):
+    with track_serialization():
+      return super().to_representation(data)
+
+
+class DynamicFieldsMixin:
+  """Limit the top-level fields of the output with ``?fields=id,datetime``."""
+
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    request = self.context.get("request")
+    fields = query_param_list(self.context, "fields")
+    if fields is not None and request.method in SAFE_METHODS:
+      for name in set(self.fields) - set(fields):
+        self.fields.pop(name)
 
 
 class TeamSerializer(serializers.ModelSerializer):
   class Meta:
     model = Team
+    list_serializer_class = TimedListSerializer
     fields = "__all__"
 
 
@@ -13,66 +49,133 @@ class TeamMemberSerializer(serializers.ModelSerializer):
 
   class Meta:
     model = TeamMember
+    list_serializer_class = TimedListSerializer
     fields = "__all__"
 
 
 class CategorySerializer(serializers.ModelSerializer):
   class Meta:
     model = Category
+    list_serializer_class = TimedListSerializer
     fields = "__all__"
 
 
+def variant_urls(variants, request):
+  """Absolute URLs of the stored image derivatives, keyed by size and format."""
+  urls = {}
+  for size, formats in variants.items():
+    if size == "source":
+      continue
+    urls[size] = {
+      extension: request.build_absolute_uri(default_storage.url(path)) if request else default_storage.url(path)
+      for extension, path in formats.items()
+    }
+  return urls
+
+
 class ProductSerializer(serializers.ModelSerializer):
   category = CategorySerializer(read_only=True)
   unit_cost = serializers.SerializerMethodField()
   price = serializers.SerializerMethodField()
+  image_variants = serializers.SerializerMethodField()
 
   def get_unit_cost(self, obj):
-    return round(float(obj.calculate_unit_cost()), 2)
+    return round(float(obj.unit_cost), 2)
   
   def get_price(self, obj):
-    return round(float(obj.price), 2)
+    return round(float(obj.sale_price), 2)
+
+  def get_image_variants(self, obj):
+    return variant_urls(obj.image_variants, self.context.get("request"))
 
   class Meta:
     model = Product
+    list_serializer_class = TimedListSerializer
     fields = "__all__"
-    fields = ["id", "name", "image", "description", "price", "unit_cost", "category", "visible"]
-    read_only_fields = ["price", "unit_cost"]
+    fields = ["id", "name", "image", "image_variants", "description", "price", "unit_cost", "category", "visible"]
+    read_only_fields = ["price", "unit_cost", "image_variants"]
 
 
 class OrderItemSerializer(serializers.ModelSerializer):
   product = ProductSerializer(read_only=True)
-  product_id = serializers.PrimaryKeyRelatedField(
-    queryset=Product.objects.all(), source="product", write_only=True
-  )
+  # Resolved to Product instances in bulk by OrderSerializer.validate_items
+  product_id = serializers.IntegerField(min_value=1, write_only=True)
 
   class Meta:
     model = OrderItem
     fields = ["id", "product", "product_id", "unit_price", "quantity"]
     read_only_fields = ["unit_price"]
 
+  def __init__(self, *args, expand_product=True, **kwargs):
+    super().__init__(*args, **kwargs)
+    if not expand_product:
+      self.fields["product"] = serializers.PrimaryKeyRelatedField(read_only=True)
 
-class OrderSerializer(serializers.ModelSerializer):
+
+class OrderSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+  """Items nest full products unless ``?expand=`` is given without ``product``."""
   items = OrderItemSerializer(many=True)
 
   class Meta:
     model = Order
+    list_serializer_class = TimedListSerializer
     fields = ["id", "datetime", "by", "items", "total_amount"]
     read_only_fields = ["id", "datetime", "total_amount"]
 
-  def create(self, validated_data):
-    items_data = validated_data.pop("items")
-    order = Order.objects.create(**validated_data)
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    expand = query_param_list(self.context, "expand")
+    if expand is not None and "product" not in expand and "items" in self.fields:
+      self.fields["items"] = OrderItemSerializer(many=True, expand_product=False)
+
+  def validate_items(self, items):
+    if not items:
+      raise serializers.ValidationError("An order needs at least one item.")
+
+    product_ids = [item["product_id"] for item in items]
+    if len(set(product_ids)) != len(product_ids):
+      raise serializers.ValidationError("Each product can only appear once per order.")
 
-    for item_data in items_data:
-      OrderItem.objects.create(order=order, **item_data)
+    products = Product.objects.in_bulk(product_ids)
+    missing = [pk for pk in product_ids if pk not in products]
+    if missing:
+      raise serializers.ValidationError(f'Invalid pk "{missing[0]}" - object does not exist.')
 
-    order.save()
+    for item in items:
+      item["product"] = products[item.pop("product_id")]
+    return items
+
+  def create(self, validated_data):
+    items_data = validated_data.pop("items")
+    items = [
+      OrderItem(
+        product=item["product"], quantity=item["quantity"], unit_price=item["product"].sale_price, btw=item["product"].btw,
+      )
+      for item in items_data
+    ]
+    total = sum((item.quantity * item.unit_price for item in items), Decimal("0"))
+
+    with transaction.atomic():
+      order = Order.objects.create(total_amount=total, **validated_data)
+      for item in items:
+        item.order = order
+      # bulk_create skips the per-item post_save signal, so the balance is settled here at once
+      OrderItem.objects.bulk_create(items)
+      ledger.record(order.by_id, -total, BalanceEntry.ORDER, order=order)
+      rollups.record_order(order, items)
+
+    prefetch_related_objects([order], "items__product__category")
     return order
 
 
-class PaymentSerializer(serializers.ModelSerializer):
+class PaymentSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
   class Meta:
     model = Payment
+    list_serializer_class = TimedListSerializer
     fields = ["id", "by", "description", "amount", "proof_picture", "completed"]
     read_only_fields = ["completed"]
+
+
+class PaymentIdsSerializer(serializers.Serializer):
+  """Payment ids posted to ``/api/payments/complete/``. IntegerField rejects booleans such as ``true``."""
+  ids = serializers.ListField(child=serializers.IntegerField(min_value=1))
@@ -1,26 +1,141 @@
-from django.db.models.signals import post_save, post_delete
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
-from .models import OrderItem
+from django.utils.timezone import localdate, now
+from rest_framework.authtoken.models import Token
+from . import events, ledger, rollups, tasks
+from .authentication import AUTH_FIELDS, evict_user_tokens, token_cache_key
+from .cache import bump_catalogue_version
+from .models import BalanceEntry, Category, ClosedDay, Order, OrderItem, Payment, Product, Settings, Team, TeamMember, Tombstone
+from .pricing import reprice_products, set_margin
+
+SYNC_MODELS = {Product: Tombstone.PRODUCT, Category: Tombstone.CATEGORY, TeamMember: Tombstone.TEAM_MEMBER}
+
+
+@receiver(post_save, sender=Settings)
+def refresh_margin_on_settings_save(sender, instance, **kwargs):
+    set_margin(instance.margin_percentage)
+    reprice_products(instance.margin_percentage)
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Team)
+@receiver([post_save, post_delete], sender=Settings)
+@receiver([post_save, post_delete], sender=ClosedDay)
+def invalidate_catalogue_cache(sender, **kwargs):
+    # Bumped after commit so no request can cache the old rows under the new version
+    transaction.on_commit(bump_catalogue_version)
+
+
+@receiver(post_save, sender=Product)
+def push_product_change(sender, instance, **kwargs):
+    events.publish("product", {"id": instance.pk, "visible": instance.visible})
+
+
+@receiver(post_delete, sender=Product)
+def push_product_delete(sender, instance, **kwargs):
+    events.publish("product", {"id": instance.pk, "deleted": True})
+
+
+@receiver(post_save, sender=Settings)
+def push_settings_change(sender, instance, **kwargs):
+    events.publish("settings", {"margin_percentage": instance.margin_percentage})
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=TeamMember)
+def leave_tombstone(sender, instance, **kwargs):
+    Tombstone.objects.create(model=SYNC_MODELS[sender], object_id=instance.pk)
+    # Keyed by the hour, so at most one purge is queued per hour
+    tasks.enqueue("purge_tombstones", key=f"purge-tombstones:{now():%Y%m%d%H}")
+
+
+@receiver(post_delete, sender=Token)
+def evict_deleted_token(sender, instance, **kwargs):
+    cache.delete(token_cache_key(instance.key))
+
+
+@receiver(pre_save, sender=User)
+def detect_auth_change(sender, instance, update_fields=None, **kwargs):
+    # Saves that only touch other fields, such as last_login on every login, keep the cache
+    instance._auth_changed = False
+    if instance._state.adding or (update_fields is not None and not set(AUTH_FIELDS).intersection(update_fields)):
+        return
+    saved = User.objects.filter(pk=instance.pk).values(*AUTH_FIELDS).first()
+    instance._auth_changed = saved is not None and any(saved[name] != getattr(instance, name) for name in AUTH_FIELDS)
+
+
+@receiver(post_save, sender=User)
+def evict_user_tokens_on_save(sender, instance, **kwargs):
+    # Deactivating a user must lock the tablet out right away, not after the cache TTL
+    if instance._auth_changed:
+        evict_user_tokens(instance)
+
+
+@receiver(post_save, sender=Product)
+def create_product_image_variants(sender, instance, **kwargs):
+    if instance.image and instance.image_variants.get("source") != instance.image.name:
+        tasks.enqueue("process_product_image", {"pk": instance.pk}, key=f"product-image:{instance.pk}:{instance.image.name}")
+
+
+@receiver(post_save, sender=Payment)
+def create_proof_variants(sender, instance, **kwargs):
+    if instance.proof_picture and instance.proof_variants.get("source") != instance.proof_picture.name:
+        tasks.enqueue("process_payment_proof", {"pk": instance.pk}, key=f"payment-proof:{instance.pk}:{instance.proof_picture.name}")
+
+
+@receiver(pre_save, sender=OrderItem)
+def remember_item_amount(sender, instance, **kwargs):
+    instance._charged_amount = (
+        sender.objects.filter(pk=instance.pk)
+        .values_list("quantity", "unit_price")
+        .first()
+    ) if instance.pk else None
 
 
 @receiver(post_save, sender=OrderItem)
 def decrease_balance_on_item_save(sender, instance, created, **kwargs):
-    member = instance.order.by
-    amount = instance.quantity * instance.product.price
+    amount = instance.quantity * instance.unit_price
+    quantity = instance.quantity
+    previous = getattr(instance, "_charged_amount", None)
+    if not created and previous:
+        old_quantity, old_unit_price = previous
+        amount -= old_quantity * old_unit_price
+        quantity -= old_quantity
+
+    rollups.record_item_change(instance, quantity, amount)
+
+    if amount > 0:
+        ledger.record(instance.order.by_id, -amount, BalanceEntry.ORDER, order=instance.order)
+    elif amount < 0:
+        ledger.record(
+            instance.order.by_id, -amount, BalanceEntry.REVERSAL,
+            description=f"Order #{instance.order_id}: {instance.product.name} changed",
+        )
 
-    if created:
-        member.balance -= amount
-    else:
-        old_quantity = sender.objects.get(pk=instance.pk).quantity if instance.pk else 0
-        diff = (instance.quantity - old_quantity) * instance.product.price
-        member.balance -= diff
 
-    member.save(update_fields=["balance"])
+def deleted_with_member(origin):
+    return isinstance(origin, TeamMember) or getattr(origin, "model", None) is TeamMember
 
 
 @receiver(post_delete, sender=OrderItem)
-def increase_balance_on_item_delete(sender, instance, **kwargs):
-    member = instance.order.by
-    amount = instance.quantity * instance.product.price
-    member.balance += amount
-    member.save(update_fields=["balance"])
+def increase_balance_on_item_delete(sender, instance, origin=None, **kwargs):
+    rollups.record_item_change(instance, -instance.quantity, -instance.quantity * instance.unit_price, create=False)
+    if deleted_with_member(origin):
+        return
+
+    # No order reference: the order itself may be deleted in the same cascade
+    ledger.record(
+        instance.order.by_id, instance.quantity * instance.unit_price, BalanceEntry.REVERSAL,
+        description=f"Order #{instance.order_id}: {instance.quantity}x {instance.product.name} removed",
+    )
+
+
+@receiver(post_delete, sender=Order)
+def remove_order_from_rollup(sender, instance, **kwargs):
+    # The revenue was already taken out by the item deletes of the same cascade
+    rollups.add_daily_orders(localdate(instance.datetime), instance.by_id, -1, 0, create=False)
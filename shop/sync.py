@@ -0,0 +1,71 @@
+"""Incremental sync of the data tablets keep locally: products, categories, members and settings.
+
+A sync token is the server time the previous sync started, in microseconds. Rows with an
+``updated_at`` after the token are sent again, hidden products and categories and deleted
+rows come back as tombstones. Without a token, or with one older than the tombstones kept,
+everything visible is sent and the client replaces its copy.
+"""
+from datetime import datetime, timedelta, timezone
+from django.conf import settings
+from django.utils.timezone import now
+from .models import Category, Product, Settings, TeamMember, Tombstone
+from .serializers import CategorySerializer, ProductSerializer, TeamMemberSerializer
+
+# Rows committed by transactions that were still running when the last sync started
+# carry an earlier updated_at, so every sync looks back this far. Clients upsert by id.
+OVERLAP = timedelta(seconds=5)
+
+SYNCED = {
+  Tombstone.PRODUCT: (Product.objects.select_related("category"), ProductSerializer),
+  Tombstone.CATEGORY: (Category.objects.all(), CategorySerializer),
+  Tombstone.TEAM_MEMBER: (TeamMember.objects.select_related("team"), TeamMemberSerializer),
+}
+
+
+def make_token(moment):
+  return str(int(moment.timestamp() * 1_000_000))
+
+
+def parse_token(token):
+  """The moment encoded in ``token``, or None when it is not a valid token."""
+  try:
+    return datetime.fromtimestamp(int(token) / 1_000_000, tz=timezone.utc) if token.isdigit() else None
+  except (ValueError, OverflowError, OSError):
+    # Unicode digits int() rejects, or a moment outside the range datetime supports
+    return None
+
+
+def tombstone_horizon():
+  return now() - timedelta(seconds=settings.SYNC_TOMBSTONE_TTL)
+
+
+def changes(since=None, context=None):
+  """Everything changed after ``since``, or a full snapshot when ``since`` is None or too old."""
+  started = now()
+  full = since is None or since < tombstone_horizon()
+  result = {"token": make_token(started), "full": full}
+  shop_settings = Settings.objects.all()
+
+  if full:
+    for name, (queryset, serializer_class) in SYNCED.items():
+      if hasattr(queryset.model, "visible"):
+        queryset = queryset.filter(visible=True)
+      result[f"{name}s"] = serializer_class(queryset.order_by("id"), many=True, context=context).data
+  else:
+    cutoff = since - OVERLAP
+    deleted = {name: set() for name in SYNCED}
+    for name, object_id in Tombstone.objects.filter(deleted_at__gt=cutoff).values_list("model", "object_id"):
+      deleted[name].add(object_id)
+
+    for name, (queryset, serializer_class) in SYNCED.items():
+      rows = list(queryset.filter(updated_at__gt=cutoff).order_by("id"))
+      if hasattr(queryset.model, "visible"):
+        deleted[name].update(row.pk for row in rows if not row.visible)
+        rows = [row for row in rows if row.visible]
+      result[f"{name}s"] = serializer_class(rows, many=True, context=context).data
+
+    result["deleted"] = {f"{name}s": sorted(ids) for name, ids in deleted.items()}
+    shop_settings = shop_settings.filter(updated_at__gt=cutoff)
+
+  result["settings"] = shop_settings.values("margin_percentage", "updated_at").first()
+  return result
@@ -0,0 +1,131 @@
+import logging
+import traceback
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.timezone import now
+from . import images, ledger, rollups
+from .cache import bump_catalogue_version
+from .models import IdempotencyKey, Job, Payment, Product, Tombstone
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+# Jobs that have been running for longer than this are assumed to belong to a dead worker
+STALE_AFTER = timedelta(minutes=10)
+
+
+def task(name):
+  def register(func):
+    registry[name] = func
+    return func
+  return register
+
+
+def enqueue(name, payload=None, key=None, max_attempts=3):
+  """Queue a registered task, or run it right away when ``TASKS_EAGER`` is set.
+
+  A job with the same idempotency key is only ever queued once; the existing job is returned.
+  """
+  if name not in registry:
+    raise KeyError(f"Unknown task {name!r}")
+  if settings.TASKS_EAGER:
+    registry[name](**(payload or {}))
+    return None
+
+  if key is not None:
+    existing = Job.objects.filter(idempotency_key=key).first()
+    if existing is not None:
+      return existing
+  try:
+    with transaction.atomic():
+      return Job.objects.create(name=name, payload=payload or {}, idempotency_key=key, max_attempts=max_attempts)
+  except IntegrityError:
+    return Job.objects.get(idempotency_key=key)
+
+
+def claim():
+  """Mark the next due job as running; the conditional update makes this safe across workers."""
+  due = (
+    Job.objects.filter(status=Job.PENDING, run_at__lte=now())
+    .order_by("run_at", "id").values_list("pk", flat=True)[:10]
+  )
+  for pk in due:
+    claimed = Job.objects.filter(pk=pk, status=Job.PENDING).update(
+      status=Job.RUNNING, attempts=F("attempts") + 1, started=now(),
+    )
+    if claimed:
+      return Job.objects.get(pk=pk)
+  return None
+
+
+def run(job):
+  try:
+    registry[job.name](**job.payload)
+  except Exception:
+    job.last_error = traceback.format_exc()
+    if job.attempts >= job.max_attempts:
+      job.status = Job.FAILED
+      job.finished = now()
+      logger.error("Job %s failed permanently", job)
+    else:
+      job.status = Job.PENDING
+      job.run_at = now() + timedelta(seconds=10 * 2 ** job.attempts)
+  else:
+    job.status = Job.DONE
+    job.finished = now()
+  job.save(update_fields=["status", "run_at", "finished", "last_error"])
+  return job
+
+
+def requeue_stale():
+  return Job.objects.filter(status=Job.RUNNING, started__lt=now() - STALE_AFTER).update(status=Job.PENDING)
+
+
+def run_pending(limit=None):
+  """Run due jobs until none are left (or ``limit`` jobs ran), returning how many ran."""
+  count = 0
+  while limit is None or count < limit:
+    job = claim()
+    if job is None:
+      break
+    run(job)
+    count += 1
+  return count
+
+
+@task("process_product_image")
+def process_product_image(pk):
+  product = Product.objects.filter(pk=pk).first()
+  if product is not None and images.process_product_image(product):
+    bump_catalogue_version()
+
+
+@task("process_payment_proof")
+def process_payment_proof(pk):
+  payment = Payment.objects.filter(pk=pk).first()
+  if payment is not None:
+    images.process_payment_proof(payment)
+
+
+@task("rebuild_daily_sales")
+def rebuild_daily_sales():
+  rollups.rebuild_daily_sales()
+
+
+@task("reconcile_balances")
+def reconcile_balances():
+  for member, expected in ledger.reconcile():
+    logger.warning("Corrected balance of %s from %s to %s", member.name, member.balance, expected)
+
+
+@task("purge_idempotency_keys")
+def purge_idempotency_keys():
+  IdempotencyKey.objects.filter(created__lt=now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)).delete()
+
+
+@task("purge_tombstones")
+def purge_tombstones():
+  Tombstone.objects.filter(deleted_at__lt=now() - timedelta(seconds=settings.SYNC_TOMBSTONE_TTL)).delete()
@@ -1,3 +1,881 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection, connections
+from django.test import AsyncClient, TestCase, TransactionTestCase, modify_settings, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
+from django.utils.timezone import localdate, now
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+
+from . import analytics, benchmarks, business_days, events, exports, ledger, query_plans, representations, rollups, sync, tasks
+from .models import BalanceEntry, Category, ClosedDay, DailyOrderTotals, DailySales, IdempotencyKey, Job, Order, OrderItem, Payment, Product, Settings, Team, TeamMember
+from .authentication import evict_user_tokens
+from .cache import CatalogueResponse, catalogue_version
+from .pricing import pricing_context
+from .serializers import OrderSerializer, ProductSerializer
+from .urls import async_urlpatterns, router
+
+
+class ShopTestCase(TestCase):
+  @classmethod
+  def setUpTestData(cls):
+    cls.user = User.objects.create_user("tablet", password="tablet")
+    cls.settings = Settings.objects.create(margin_percentage=Decimal("10.00"))
+    cls.team = Team.objects.create(number=1, start_date=date(2025, 9, 23))
+    cls.member = TeamMember.objects.create(name="Jan", email="jan@example.com", team=cls.team)
+    cls.category = Category.objects.create(name="Drinks", icon="cup")
+
+  def setUp(self):
+    cache.clear()
+    self.client = APIClient()
+    self.client.force_authenticate(self.user)
+
+  def create_products(self, count, category=None):
+    return [
+      Product.objects.create(
+        name=f"Product {i}", image="product_images/product.png", category=category or self.category,
+        cost_ex_btw=Decimal("12.00"), pack_size=24, btw=9,
+      )
+      for i in range(count)
+    ]
+
+  def count_queries(self, method, url, **kwargs):
+    with CaptureQueriesContext(connection) as ctx:
+      response = getattr(self.client, method)(url, **kwargs)
+    self.assertLess(response.status_code, 400, response.content)
+    return len(ctx.captured_queries)
+
+
+class PricingTests(ShopTestCase):
+  def test_price_uses_margin_and_rounds_to_five_cents(self):
+    product = self.create_products(1)[0]
+    # 12.00 * 1.09 / 24 = 0.545 -> * 1.10 = 0.5995 -> 0.60
+    self.assertEqual(product.price, Decimal("0.60"))
+
+  def test_product_list_query_count_is_constant(self):
+    self.create_products(2)
+    small = self.count_queries("get", "/api/products/")
+
+    other = Category.objects.create(name="Snacks", icon="cookie")
+    self.create_products(20, category=other)
+    cache.clear()
+    large = self.count_queries("get", "/api/products/")
+
+    self.assertEqual(small, large)
+
+  def test_margin_change_applies_within_same_context(self):
+    product = self.create_products(1)[0]
+    with pricing_context():
+      self.assertEqual(product.calculate_price(), Decimal("0.60"))
+      self.settings.margin_percentage = Decimal("0.00")
+      self.settings.save()
+      with self.assertNumQueries(0):
+        self.assertEqual(product.calculate_price(), Decimal("0.55"))
+
+  def test_saving_other_fields_skips_the_margin_lookup(self):
+    product = Product.objects.get(pk=self.create_products(1)[0].pk)
+    with CaptureQueriesContext(connection) as ctx:
+      product.name = "Renamed"
+      product.save()
+    self.assertFalse([query for query in ctx.captured_queries if "shop_settings" in query["sql"]])
+
+    product.pack_size = 12
+    product.save(update_fields=["pack_size"])
+    product.refresh_from_db()
+    self.assertEqual(product.sale_price, Decimal("1.20"))
+
+  def test_margin_change_reprices_stored_columns(self):
+    product = self.create_products(1)[0]
+    self.assertEqual((product.unit_cost, product.sale_price), (Decimal("0.5450"), Decimal("0.60")))
+
+    self.settings.margin_percentage = Decimal("50.00")
+    self.settings.save()
+    product.refresh_from_db()
+    self.assertEqual(product.price, Decimal("0.80"))
+    self.assertEqual(Product.objects.filter(sale_price__gte=Decimal("0.80")).count(), 1)
+
+
+class OrderCreateTests(ShopTestCase):
+  def place_order(self, products):
+    payload = {
+      "by": self.member.pk,
+      "items": [{"product_id": product.pk, "quantity": 2} for product in products],
+    }
+    return self.count_queries("post", "/api/orders/", data=payload, format="json")
+
+  def test_order_totals_and_balance(self):
+    products = self.create_products(3)
+    self.place_order(products)
+
+    order = Order.objects.get()
+    self.assertEqual(order.total_amount, Decimal("3.60"))
+    self.assertEqual(list(order.items.values_list("unit_price", flat=True)), [Decimal("0.60")] * 3)
+    self.member.refresh_from_db()
+    self.assertEqual(self.member.balance, Decimal("-3.60"))
+
+  def test_order_query_count_is_constant(self):
+    small = self.place_order(self.create_products(1))
+    large = self.place_order(self.create_products(10))
+    self.assertEqual(small, large)
+
+  def test_unknown_product_is_rejected(self):
+    payload = {"by": self.member.pk, "items": [{"product_id": 999, "quantity": 1}]}
+    response = self.client.post("/api/orders/", data=payload, format="json")
+    self.assertEqual(response.status_code, 400)
+    self.assertFalse(Order.objects.exists())
+
+
+class ConcurrentOrderTests(TransactionTestCase):
+  writers = 8
+  orders_per_writer = 10
+
+  def setUp(self):
+    self.user = User.objects.create_user("tablet")
+    Settings.objects.create(margin_percentage=Decimal("10.00"))
+    team = Team.objects.create(number=1, start_date=date(2025, 9, 23))
+    self.members = [TeamMember.objects.create(name=f"Member {i}", email=f"{i}@example.com", team=team) for i in range(4)]
+    category = Category.objects.create(name="Drinks", icon="cup")
+    self.product = Product.objects.create(
+      name="Cola", image="product_images/product.png", category=category, cost_ex_btw=Decimal("12.00"), pack_size=24,
+    )
+
+  def place_orders(self, writer):
+    client = APIClient()
+    client.force_authenticate(self.user)
+    try:
+      return [
+        client.post("/api/orders/", data={
+          "by": self.members[(writer + i) % len(self.members)].pk,
+          "items": [{"product_id": self.product.pk, "quantity": 1}],
+        }, format="json").status_code
+        for i in range(self.orders_per_writer)
+      ]
+    finally:
+      connections.close_all()
+
+  def test_parallel_writers_all_succeed(self):
+    with ThreadPoolExecutor(self.writers) as pool:
+      statuses = [status for result in pool.map(self.place_orders, range(self.writers)) for status in result]
+
+    total = self.writers * self.orders_per_writer
+    self.assertEqual(statuses, [201] * total)
+    self.assertEqual(Order.objects.count(), total)
+    self.product.refresh_from_db()
+    self.assertEqual(self.product.total_ordered, total)
+    self.assertEqual(ledger.reconcile(dry_run=True), [])
+
+
+class TokenAuthenticationTests(ShopTestCase):
+  def setUp(self):
+    super().setUp()
+    self.token = Token.objects.create(user=self.user)
+    self.client = APIClient(headers={"Authorization": f"Token {self.token.key}"})
+    self.client.get("/api/teams/")
+
+  def test_token_is_cached(self):
+    self.assertEqual(self.count_queries("get", "/api/teams/"), 0)
+    self.assertEqual(self.client.get("/api/teams/", headers={"Authorization": "Token wrong"}).status_code, 401)
+
+  def test_deleting_the_token_or_deactivating_the_user_evicts_it(self):
+    self.user.is_active = False
+    self.user.save()
+    self.assertEqual(self.client.get("/api/teams/").status_code, 401)
+
+    self.user.is_active = True
+    self.user.save()
+    self.assertEqual(self.client.get("/api/teams/").status_code, 200)
+    self.token.delete()
+    self.assertEqual(self.client.get("/api/teams/").status_code, 401)
+
+  def test_only_auth_changes_evict_the_token(self):
+    self.user.last_login = now()
+    self.user.save(update_fields=["last_login"])
+    self.user.first_name = "Tablet"
+    self.user.save()
+    self.assertEqual(self.count_queries("get", "/api/teams/"), 0)
+
+    User.objects.filter(pk=self.user.pk).update(is_active=False)
+    evict_user_tokens(self.user)
+    self.assertEqual(self.client.get("/api/teams/").status_code, 401)
+
+  def test_get_token_still_works(self):
+    self.user.set_password("tablet")
+    self.user.save()
+    response = APIClient().post("/api/get-token/", {"username": "tablet", "password": "tablet"})
+    self.assertEqual(response.data, {"token": self.token.key})
+
+
+class IdempotencyTests(ShopTestCase):
+  def setUp(self):
+    super().setUp()
+    self.product = self.create_products(1)[0]
+    self.order = {"by": self.member.pk, "items": [{"product_id": self.product.pk, "quantity": 2}]}
+
+  def post(self, url, data, key):
+    return self.client.post(url, data=data, format="json", headers={"Idempotency-Key": key})
+
+  def test_retried_order_is_replayed_without_writing(self):
+    first = self.post("/api/orders/", self.order, "tablet-1")
+    self.assertEqual(first.status_code, 201)
+
+    with self.assertNumQueries(1):
+      retry = self.post("/api/orders/", self.order, "tablet-1")
+    self.assertEqual((retry.status_code, retry.data), (201, first.data))
+    self.assertEqual(retry["Idempotent-Replayed"], "true")
+
+    self.member.refresh_from_db()
+    self.assertEqual(Order.objects.count(), 1)
+    self.assertEqual(self.member.balance, -Decimal(first.data["total_amount"]))
+
+  def test_key_reuse_and_failed_requests(self):
+    self.assertEqual(self.post("/api/orders/", {**self.order, "items": []}, "tablet-2").status_code, 400)
+    self.assertEqual(self.post("/api/orders/", self.order, "tablet-2").status_code, 201)
+    self.assertEqual(self.post("/api/orders/", {**self.order, "by": self.member.pk + 1}, "tablet-2").status_code, 422)
+
+    payment = {"by": self.member.pk, "amount": "5.00"}
+    self.assertEqual(self.post("/api/payments/", payment, "tablet-2").status_code, 201)
+    self.assertEqual(self.post("/api/payments/", payment, "tablet-2").status_code, 201)
+    self.assertEqual(Payment.objects.count(), 1)
+
+  def test_concurrent_uncommitted_key_is_a_conflict(self):
+    # The competing request's key row violates the constraint but is not visible yet
+    with mock.patch.object(IdempotencyKey.objects, "create", side_effect=IntegrityError):
+      response = self.post("/api/orders/", self.order, "tablet-5")
+    self.assertEqual(response.status_code, 409)
+    self.assertEqual(Order.objects.count(), 0)
+
+  def test_old_keys_are_purged(self):
+    self.post("/api/orders/", self.order, "tablet-3")
+    IdempotencyKey.objects.update(created=now() - timedelta(days=2))
+    with override_settings(TASKS_EAGER=True):
+      self.post("/api/orders/", self.order, "tablet-4")
+    self.assertEqual(list(IdempotencyKey.objects.values_list("key", flat=True)), ["tablet-4"])
+
+
+class LedgerTests(ShopTestCase):
+  def test_order_lifecycle_is_recorded_in_ledger(self):
+    product = self.create_products(1)[0]
+    self.client.post("/api/orders/", data={"by": self.member.pk, "items": [{"product_id": product.pk, "quantity": 5}]}, format="json")
+    item = OrderItem.objects.get()
+
+    item.quantity = 2
+    item.save()
+    item.delete()
+
+    kinds = list(BalanceEntry.objects.order_by("pk").values_list("kind", "amount"))
+    self.assertEqual(kinds, [
+      (BalanceEntry.ORDER, Decimal("-3.00")),
+      (BalanceEntry.REVERSAL, Decimal("1.80")),
+      (BalanceEntry.REVERSAL, Decimal("1.20")),
+    ])
+    self.member.refresh_from_db()
+    self.assertEqual(self.member.balance, Decimal("0.00"))
+
+  def test_deleting_an_order_refunds_member(self):
+    products = self.create_products(2)
+    self.client.post("/api/orders/", data={"by": self.member.pk, "items": [{"product_id": p.pk, "quantity": 1} for p in products]}, format="json")
+
+    Order.objects.get().delete()
+
+    self.member.refresh_from_db()
+    self.assertEqual(self.member.balance, Decimal("0.00"))
+    self.assertEqual(ledger.reconcile(dry_run=True), [])
+
+  def test_reconcile_rebuilds_drifted_balances(self):
+    ledger.record(self.member.pk, Decimal("5.00"), BalanceEntry.PAYMENT)
+    TeamMember.objects.filter(pk=self.member.pk).update(balance=Decimal("99.00"))
+
+    drifted = ledger.reconcile()
+
+    self.assertEqual([(member.pk, expected) for member, expected in drifted], [(self.member.pk, Decimal("5.00"))])
+    self.member.refresh_from_db()
+    self.assertEqual(self.member.balance, Decimal("5.00"))
+    self.assertEqual(ledger.reconcile(), [])
+
+  def test_saving_a_stale_member_keeps_the_ledger_balance(self):
+    stale = TeamMember.objects.get(pk=self.member.pk)
+    ledger.record(self.member.pk, Decimal("5.00"), BalanceEntry.PAYMENT)
+
+    stale.name = "Jantje"
+    stale.save()
+    self.client.force_login(User.objects.create_superuser("admin"))
+    self.client.post(f"/admin/shop/teammember/{stale.pk}/change/", {
+      "name": "Jantje", "email": "jantje@example.com", "team": self.team.pk,
+    })
+
+    self.member.refresh_from_db()
+    self.assertEqual((self.member.name, self.member.email, self.member.balance), ("Jantje", "jantje@example.com", Decimal("5.00")))
+    self.assertEqual(ledger.reconcile(dry_run=True), [])
+
+  def create_payments(self, count):
+    other, _ = TeamMember.objects.get_or_create(name="Piet", team=self.team, defaults={"email": "piet@example.com"})
+    members = [self.member, other]
+    return Payment.objects.bulk_create(
+      Payment(by=members[i % 2], amount=Decimal("2.50")) for i in range(count)
+    )
+
+  def test_batch_completion_uses_constant_statements(self):
+    statements = []
+    for count in (3, 40):
+      payments = self.create_payments(count)
+      with CaptureQueriesContext(connection) as ctx:
+        completed = ledger.complete_payments([payment.pk for payment in payments])
+      statements.append(len(ctx.captured_queries))
+      self.assertEqual(len(completed), count)
+    self.assertEqual(statements[0], statements[1])
+
+    self.assertEqual(ledger.complete_payments(completed), [])
+    self.member.refresh_from_db()
+    self.assertEqual(self.member.balance, Decimal("2.50") * (2 + 20))
+    self.assertEqual(BalanceEntry.objects.count(), 43)
+    self.assertEqual(ledger.reconcile(dry_run=True), [])
+
+  def test_batch_completion_from_admin_and_api(self):
+    payments = self.create_payments(4)
+    self.assertEqual(self.client.post("/api/payments/complete/", {"ids": [payments[0].pk]}, format="json").status_code, 403)
+
+    admin = User.objects.create_superuser("admin")
+    self.client.force_authenticate(admin)
+    for ids in ([True], ["x"], None, 5):
+      self.assertEqual(self.client.post("/api/payments/complete/", {"ids": ids}, format="json").status_code, 400, ids)
+    self.assertFalse(Payment.objects.filter(completed=True).exists())
+    response = self.client.post("/api/payments/complete/", {"ids": [payments[0].pk, payments[1].pk]}, format="json")
+    self.assertEqual(response.data, {"completed": [payments[0].pk, payments[1].pk], "skipped": []})
+
+    self.client.force_login(admin)
+    self.client.post("/admin/shop/payment/", {
+      "action": "complete_payments", "_selected_action": [payment.pk for payment in payments],
+    })
+    self.assertFalse(Payment.objects.filter(completed=False).exists())
+    self.assertEqual(BalanceEntry.objects.filter(kind=BalanceEntry.PAYMENT).count(), 4)
+
+
+class OrderListTests(ShopTestCase):
+  def setUp(self):
+    super().setUp()
+    self.products = self.create_products(2)
+    other = TeamMember.objects.create(name="Piet", email="piet@example.com", team=self.team)
+    for by in (self.member, self.member, other):
+      self.client.post("/api/orders/", data={"by": by.pk, "items": [{"product_id": self.products[0].pk, "quantity": 1}]}, format="json")
+
+  def test_orders_are_cursor_paginated(self):
+    response = self.client.get("/api/orders/", {"page_size": 2})
+    self.assertEqual(len(response.data["results"]), 2)
+    self.assertIsNotNone(response.data["next"])
+
+    response = self.client.get(response.data["next"])
+    self.assertEqual(len(response.data["results"]), 1)
+    self.assertIsNone(response.data["next"])
+
+  def test_orders_filter_by_member(self):
+    response = self.client.get("/api/orders/", {"by": self.member.pk})
+    self.assertEqual(len(response.data["results"]), 2)
+    for params in ({"by": "x"}, {"by": "\u00b2"}, {"start": "2025-02-30"}, {"end": "2025-13-01"}):
+      self.assertEqual(self.client.get("/api/orders/", params).status_code, 400, params)
+    self.assertEqual(self.client.get("/api/payments/", {"by": "\u00b2"}).status_code, 400)
+
+  def test_fields_and_expand_select_the_payload(self):
+    response = self.client.get("/api/orders/", {"fields": "id,items", "expand": ""})
+    order = response.data["results"][0]
+    self.assertEqual(set(order), {"id", "items"})
+    self.assertEqual(order["items"][0]["product"], self.products[0].pk)
+
+
+class LeanListTests(ShopTestCase):
+  def setUp(self):
+    super().setUp()
+    other = Category.objects.create(name="Snacks", icon="cookie", visible=False)
+    self.products = self.create_products(2) + self.create_products(2, category=other)
+    Product.objects.filter(pk=self.products[0].pk).update(
+      image_variants={"source": {"png": "a.png"}, "128": {"webp": "product_images/128/a.webp"}},
+    )
+    for product in self.products[:3]:
+      self.client.post("/api/orders/", data={"by": self.member.pk, "items": [
+        {"product_id": product.pk, "quantity": 2}, {"product_id": self.products[3].pk, "quantity": 1},
+      ]}, format="json")
+
+  def assertSameJSON(self, data, expected):
+    self.assertEqual(JSONRenderer().render(data), JSONRenderer().render(expected))
+
+  def test_lists_match_the_serializers(self):
+    response = self.client.get("/api/products/")
+    products = Product.objects.select_related("category").order_by("-total_ordered", "id")
+    self.assertSameJSON(response.data, ProductSerializer(products, many=True, context={"request": response.wsgi_request}).data)
+
+    for params in ({}, {"expand": ""}, {"fields": "datetime,items,id"}):
+      with self.subTest(params):
+        response = self.client.get("/api/orders/", params)
+        serializer = OrderSerializer(Order.objects.order_by("-datetime", "-id"), many=True, context={"request": Request(response.wsgi_request)})
+        self.assertSameJSON(response.data["results"], serializer.data)
+
+  def test_serializer_field_missing_from_the_lean_list_fails(self):
+    with mock.patch.object(representations, "PRODUCT_FIELDS", (*representations.PRODUCT_FIELDS, "stock")):
+      with self.assertRaises(ImproperlyConfigured):
+        self.client.get("/api/products/")
+
+  def test_order_list_queries(self):
+    self.assertEqual(self.count_queries("get", "/api/orders/"), 3)
+    self.assertEqual(self.count_queries("get", "/api/orders/", data={"expand": ""}), 2)
+    self.assertEqual(self.count_queries("get", "/api/orders/", data={"fields": "id,total_amount"}), 1)
+
+
+class ProductCounterTests(ShopTestCase):
+  def test_counters_follow_orders_and_rebuild(self):
+    first, second = self.create_products(2)
+    self.client.post("/api/orders/", data={"by": self.member.pk, "items": [
+      {"product_id": first.pk, "quantity": 1}, {"product_id": second.pk, "quantity": 3},
+    ]}, format="json")
+
+    response = self.client.get("/api/products/")
+    self.assertEqual([product["id"] for product in response.data], [second.pk, first.pk])
+
+    OrderItem.objects.get(product=second).delete()
+    second.refresh_from_db()
+    self.assertEqual(second.total_ordered, 0)
+
+    Product.objects.update(total_ordered=0)
+    rollups.rebuild_product_counters()
+    first.refresh_from_db()
+    self.assertEqual(first.total_ordered, 1)
+
+
+class AnalyticsTests(ShopTestCase):
+  def setUp(self):
+    super().setUp()
+    self.first, self.second = self.create_products(2)
+    for quantity in (1, 2):
+      self.client.post("/api/orders/", data={"by": self.member.pk, "items": [
+        {"product_id": self.first.pk, "quantity": quantity}, {"product_id": self.second.pk, "quantity": 1},
+      ]}, format="json")
+
+  def test_analytics_read_incremental_rollups(self):
+    top = self.client.get("/api/analytics/top-products/").data
+    self.assertEqual(top, {"labels": ["Product 0", "Product 1"], "values": [3, 2]})
+
+    summary = self.client.get("/api/analytics/summary/").data
+    self.assertEqual(summary["total_orders"], 2)
+    self.assertEqual(summary["total_spent"], Decimal("3.00"))
+
+    sales = self.client.get("/api/analytics/sales-over-time/", {"days": 1}).data
+    self.assertEqual(sales["values"][-1], 5.0)
+
+  def test_dashboard_matches_individual_endpoints(self):
+    # Three rollup queries plus the calendar, which is cached with the catalogue
+    with self.assertNumQueries(5):
+      dashboard = self.client.get("/api/analytics/dashboard/", {"user_id": self.member.pk, "days": 7}).data
+    self.assertEqual(dashboard["top_products"], self.client.get("/api/analytics/top-products/").data)
+    self.assertEqual(dashboard["top_users"], self.client.get("/api/analytics/top-users/").data)
+    self.assertEqual(dashboard["summary"], self.client.get("/api/analytics/summary/", {"user_id": self.member.pk}).data)
+    self.assertEqual(dashboard["sales_over_time"], self.client.get("/api/analytics/sales-over-time/", {"days": 7}).data)
+
+    with self.assertNumQueries(0):
+      self.client.get("/api/analytics/dashboard/", {"user_id": self.member.pk, "days": 7})
+
+  def test_rollups_survive_deletes_and_rebuild(self):
+    Order.objects.first().delete()
+    incremental = list(DailySales.objects.order_by("product").values_list("quantity", "revenue"))
+    totals = list(DailyOrderTotals.objects.values_list("order_count", "total_amount"))
+
+    rollups.rebuild_daily_sales()
+    self.assertEqual(list(DailySales.objects.order_by("product").values_list("quantity", "revenue")), incremental)
+    self.assertEqual(list(DailyOrderTotals.objects.values_list("order_count", "total_amount")), totals)
+    self.assertEqual(totals, [(1, Decimal("1.20"))])
+
+  def test_deleting_a_member_cleans_up(self):
+    self.member.delete()
+    self.assertFalse(DailySales.objects.exists())
+    self.assertFalse(BalanceEntry.objects.exists())
+
+
+class BusinessDayTests(ShopTestCase):
+  def test_weekdays_between_matches_counting_each_day(self):
+    start = date(2025, 9, 1)
+    for offset in range(7):
+      for length in range(-1, 30):
+        first, last = start + timedelta(days=offset), start + timedelta(days=offset + length)
+        expected = sum(1 for i in range(length + 1) if (first + timedelta(days=i)).weekday() < 5)
+        self.assertEqual(business_days.weekdays_between(first, last), expected, (first, last))
+
+  def test_closed_days_lower_the_open_day_count(self):
+    # Tuesday 23 September up to and including Friday 3 October: nine weekdays
+    end = date(2025, 10, 3)
+    self.assertEqual(business_days.calendar().open_days(end), 9)
+
+    with self.captureOnCommitCallbacks(execute=True):
+      ClosedDay.objects.create(date=date(2025, 9, 26), reason="Sports day")
+      ClosedDay.objects.create(date=date(2025, 9, 27), reason="Saturday, ignored")
+    calendar = business_days.calendar()
+    self.assertEqual(calendar.open_days(end), 8)
+    self.assertNotIn(date(2025, 9, 26), list(calendar.open_dates(date(2025, 9, 22), end)))
+
+  def test_summary_averages_over_open_days(self):
+    self.client.post("/api/orders/", data={"by": self.member.pk, "items": [
+      {"product_id": self.create_products(1)[0].pk, "quantity": 1},
+    ]}, format="json")
+    with self.captureOnCommitCallbacks(execute=True):
+      self.team.start_date = localdate()
+      self.team.save()
+    summary = analytics.summary()
+    open_today = business_days.calendar().open_days(localdate())
+    self.assertEqual(summary["avg_orders_per_day"], 1.0 if open_today else 0.0)
+
+
+class SyncTests(ShopTestCase):
+  def setUp(self):
+    super().setUp()
+    self.kept, self.hidden, self.removed = self.create_products(3)
+    self.first = self.client.get("/api/sync/").data
+
+  def sync(self, token):
+    response = self.client.get("/api/sync/", {"since": token})
+    self.assertEqual(response.status_code, 200)
+    return response.data
+
+  def test_full_sync_then_only_changes(self):
+    self.assertTrue(self.first["full"])
+    self.assertEqual(len(self.first["products"]), 3)
+    self.assertEqual(self.first["team_members"][0]["name"], "Jan")
+
+    sync.OVERLAP, overlap = timedelta(0), sync.OVERLAP
+    self.addCleanup(setattr, sync, "OVERLAP", overlap)
+    with self.assertNumQueries(5):
+      idle = self.sync(self.first["token"])
+    self.assertFalse(idle["full"])
+    self.assertEqual((idle["products"], idle["team_members"], idle["settings"]), ([], [], None))
+
+    self.hidden.visible = False
+    self.hidden.save()
+    removed_pk = self.removed.pk
+    self.removed.delete()
+    self.client.post("/api/orders/", data={"by": self.member.pk, "items": [{"product_id": self.kept.pk, "quantity": 1}]}, format="json")
+
+    changed = self.sync(idle["token"])
+    self.assertEqual(changed["products"], [])
+    self.assertEqual(changed["deleted"]["products"], sorted([self.hidden.pk, removed_pk]))
+    self.assertEqual([member["balance"] for member in changed["team_members"]], ["-0.60"])
+
+  def test_repricing_and_bad_tokens(self):
+    self.settings.margin_percentage = Decimal("20.00")
+    self.settings.save()
+    changed = self.sync(self.first["token"])
+    self.assertEqual(len(changed["products"]), 3)
+    self.assertEqual(changed["settings"]["margin_percentage"], Decimal("20.00"))
+
+    self.assertTrue(self.sync("0")["full"])
+    for since in ("yesterday", "99999999999999999999", "\u00b2", "9" * 400):
+      self.assertEqual(self.client.get("/api/sync/", {"since": since}).status_code, 400, since)
+
+
+class EventTests(ShopTestCase):
+  class Recorder:
+    def __init__(self):
+      self.events = []
+
+    def deliver(self, event):
+      self.events.append(event)
+      return True
+
+  def test_changes_are_pushed_after_commit(self):
+    recorder = self.Recorder()
+    bus = events.get_bus()
+    bus.subscriptions.add(recorder)
+    self.addCleanup(bus.subscriptions.discard, recorder)
+    product = self.create_products(1)[0]
+
+    with self.captureOnCommitCallbacks(execute=True):
+      self.client.post("/api/orders/", data={"by": self.member.pk, "items": [{"product_id": product.pk, "quantity": 1}]}, format="json")
+      self.assertEqual(recorder.events, [])
+    self.assertEqual(recorder.events, [{"type": "balance", "data": {"member": self.member.pk, "balance": Decimal("-0.60")}}])
+
+    recorder.events.clear()
+    with self.captureOnCommitCallbacks(execute=True):
+      product.visible = False
+      product.save()
+      self.settings.margin_percentage = Decimal("15.00")
+      self.settings.save()
+    self.assertEqual([event["type"] for event in recorder.events], ["product", "settings"])
+    self.assertFalse(recorder.events[0]["data"]["visible"])
+
+  def test_idle_streams_stay_small(self):
+    result = benchmarks.event_stream_memory(connections=50)
+    self.assertTrue(result["event_delivered_to_all"])
+    self.assertEqual(result["subscribers_after_disconnect"], 0)
+    self.assertLess(result["bytes_per_connection"], 100_000)
+
+
+class ExportTests(ShopTestCase):
+  def setUp(self):
+    super().setUp()
+    nine, zero = self.create_products(2)
+    zero.btw = 0
+    zero.save()
+    for quantity in (1, 3):
+      self.client.post("/api/orders/", data={"by": self.member.pk, "items": [
+        {"product_id": nine.pk, "quantity": quantity}, {"product_id": zero.pk, "quantity": 1},
+      ]}, format="json")
+
+  def read(self, url, **params):
+    response = self.client.get(url, params)
+    self.assertEqual(response.status_code, 200)
+    self.assertTrue(response.streaming)
+    return b"".join(response.streaming_content).decode()
+
+  def test_csv_export_ends_with_btw_subtotals(self):
+    lines = self.read("/api/exports/orders/").splitlines()
+    self.assertEqual(lines[0], ",".join(exports.ORDER_ITEM_COLUMNS))
+    self.assertEqual(len(lines[1:lines.index("")]), 4)
+
+    subtotals = {row[0]: row for row in (line.split(",") for line in lines[lines.index("") + 2:])}
+    self.assertEqual(set(subtotals), {"0", "9", "21"})
+    # Four units at 0.60 incl. 9% BTW
+    self.assertEqual(subtotals["9"][1:], ["4", "2.20", "0.20", "2.40"])
+    self.assertEqual(subtotals["21"][1:], ["0", "0.00", "0.00", "0.00"])
+
+  def test_export_uses_the_rate_at_sale_time(self):
+    before = self.read("/api/exports/orders/")
+    Product.objects.update(btw=21)
+    self.assertEqual(self.read("/api/exports/orders/"), before)
+
+  def test_jsonl_export_filters_by_period_and_team(self):
+    records = [json.loads(line) for line in self.read("/api/exports/orders/", output="jsonl").splitlines()]
+    self.assertEqual([r["type"] for r in records].count("order_item"), 4)
+
+    self.assertEqual(self.read("/api/exports/orders/", team=self.team.pk + 1).count("\n"), 6)
+    tomorrow = (localdate() + timedelta(days=1)).isoformat()
+    self.assertEqual(self.read("/api/exports/orders/", start=tomorrow).count("\n"), 6)
+
+  def test_export_reads_rows_in_constant_queries(self):
+    with self.assertNumQueries(1):
+      self.read("/api/exports/orders/")
+    with self.assertNumQueries(1):
+      self.read("/api/exports/payments/", output="jsonl")
+    for params in ({"output": "xlsx"}, {"start": "2025-02-30"}, {"team": "\u00b2"}):
+      self.assertEqual(self.client.get("/api/exports/orders/", params).status_code, 400, params)
+
+
+class AdminChangelistTests(TestCase):
+  # Session, user, counts and filter choices, independent of the number of rows shown
+  changelist_queries = {
+    "order": 9, "orderitem": 9, "teammember": 7, "payment": 6, "product": 7, "balanceentry": 6, "job": 7,
+  }
+
+  def test_changelist_queries_do_not_grow_with_rows(self):
+    benchmarks.seed(products=30, orders=200, members=20, days=10)
+    self.client.force_login(User.objects.create_superuser("admin"))
+    for model, expected in self.changelist_queries.items():
+      with self.subTest(model), self.assertNumQueries(expected):
+        self.assertEqual(self.client.get(f"/admin/shop/{model}/").status_code, 200)
+
+  def test_team_member_list_selects_teams(self):
+    benchmarks.seed(products=5, orders=20, members=20, days=2)
+    client = APIClient()
+    client.force_authenticate(User.objects.create_user("tablet"))
+    with self.assertNumQueries(1):
+      self.assertEqual(len(client.get("/api/team-members/").data), 20)
+
+
+class QueryPlanTests(TestCase):
+  def test_list_filters_use_indexes(self):
+    benchmarks.seed(products=50, orders=300, members=20)
+    plans = {name: (plan, scans) for name, plan, scans in query_plans.audit()}
+    for name in ("order-list", "order-list?by", "order-list?start", "payment-list?by", "payment-list?completed", "product-counters"):
+      self.assertEqual(plans[name][1], [], plans[name][0])
+    self.assertIn("payment_completed_id_idx", plans["payment-list?completed"][0])
+
+  def test_full_scans_per_vendor(self):
+    plan = "Limit\n  ->  Seq Scan on shop_payment\n  ->  Index Scan using order_by_datetime_idx on shop_order"
+    self.assertEqual(query_plans.full_scans(plan, "postgresql"), ["->  Seq Scan on shop_payment"])
+    self.assertEqual(query_plans.full_scans("2 0 0 SCAN shop_payment", "sqlite", limited=True), [])
+    self.assertEqual(query_plans.full_scans("2 0 0 SCAN shop_product USING COVERING INDEX idx", "sqlite"), [])
+
+
+class CatalogueCacheTests(ShopTestCase):
+  def test_cached_until_catalogue_changes(self):
+    product = self.create_products(1)[0]
+    response = self.client.get("/api/products/")
+    self.assertEqual(self.count_queries("get", "/api/products/"), 0)
+
+    not_modified = self.client.get("/api/products/", HTTP_IF_NONE_MATCH=response["ETag"])
+    self.assertEqual(not_modified.status_code, 304)
+
+    with self.captureOnCommitCallbacks(execute=True):
+      product.name = "Renamed"
+      product.save()
+    self.assertEqual(self.client.get("/api/products/", HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 200)
+    self.assertEqual(self.client.get("/api/products/").data[0]["name"], "Renamed")
+
+  def test_rebuilt_response_gets_a_new_etag(self):
+    first, second = self.create_products(2)
+    response = self.client.get("/api/products/")
+    self.assertEqual([product["id"] for product in response.data], [first.pk, second.pk])
+
+    # Counters change without a catalogue version bump, the cached body expires instead
+    rollups.add_product_sales({second.pk: 3})
+    self.assertEqual(self.client.get("/api/products/", HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+    cache.delete(CatalogueResponse(response.wsgi_request, catalogue_version()).key)
+
+    rebuilt = self.client.get("/api/products/", HTTP_IF_NONE_MATCH=response["ETag"])
+    self.assertEqual(rebuilt.status_code, 200)
+    self.assertNotEqual(rebuilt["ETag"], response["ETag"])
+    self.assertEqual([product["id"] for product in rebuilt.data], [second.pk, first.pk])
+
+
+class BenchmarkTests(TestCase):
+  def test_benchmark_drives_every_route(self):
+    benchmarks.seed(products=10, orders=30, members=4, days=5)
+    results = benchmarks.run(iterations=1)
+
+    self.assertIn("analytics-summary", results)
+    self.assertIn("order-create", results)
+    for name, result in results.items():
+      self.assertLess(result["status"], 400, name)
+
+  def test_cached_token_authentication_drops_the_auth_query(self):
+    self.assertEqual(benchmarks.auth_queries(requests=10), {"token": 1, "cached_token": 0.1})
+
+  def test_lean_representations_render_identical_json(self):
+    benchmarks.seed(products=20, orders=40, members=4, days=5)
+    results = benchmarks.serializer_speed(orders=20, iterations=1)
+    self.assertEqual({name: result["identical"] for name, result in results.items()}, {"products": True, "orders": True})
+
+
+@modify_settings(MIDDLEWARE={"prepend": "shop.middleware.RequestMetricsMiddleware"})
+class RequestMetricsTests(ShopTestCase):
+  def test_server_timing_header(self):
+    response = self.client.get("/api/categories/")
+    self.assertRegex(response["Server-Timing"], r'^db;desc="\d+ queries";dur=[\d.]+, serialize;dur=[\d.]+, total;dur=[\d.]+$')
+
+  @override_settings(SLOW_REQUEST_QUERIES=1, DUPLICATE_QUERY_THRESHOLD=1000)
+  def test_slow_requests_are_logged_with_view_name(self):
+    self.create_products(1)
+    with self.assertLogs("shop.requests", "WARNING") as logs:
+      self.client.get("/api/products/")
+    record = json.loads(logs.records[0].getMessage())
+    self.assertEqual(record["event"], "slow_request")
+    self.assertEqual(record["view"], "ProductViewSet.list")
+
+
+class ImageVariantTests(ShopTestCase):
+  def setUp(self):
+    super().setUp()
+    self.media_root = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.media_root)
+    media = override_settings(MEDIA_ROOT=self.media_root)
+    media.enable()
+    self.addCleanup(media.disable)
+
+  def upload(self, name="photo.png"):
+    buffer = BytesIO()
+    Image.new("RGB", (1200, 800), "red").save(buffer, "PNG")
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/png")
+
+  def test_product_upload_creates_hashed_variants(self):
+    product = Product.objects.create(name="Cola", image=self.upload(), category=self.category)
+    self.assertEqual(product.image_variants, {})
+    tasks.run_pending()
+    product.refresh_from_db()
+
+    variants = product.image_variants
+    self.assertEqual(variants["source"], product.image.name)
+    with Image.open(os.path.join(self.media_root, variants["thumb"]["webp"])) as thumb:
+      self.assertEqual((thumb.format, thumb.size), ("WEBP", (160, 107)))
+
+    data = self.client.get(f"/api/products/{product.pk}/").data
+    self.assertTrue(data["image_variants"]["medium"]["jpg"].startswith("http://testserver/media/product_images/derivatives/"))
+
+    again = Product.objects.create(name="Cola light", image=self.upload("other.png"), category=self.category)
+    tasks.run_pending()
+    again.refresh_from_db()
+    self.assertEqual(again.image_variants["thumb"], variants["thumb"])
+
+
+class JobQueueTests(TestCase):
+  def setUp(self):
+    self.calls = []
+    tasks.registry["test_task"] = self.flaky_task
+    self.addCleanup(tasks.registry.pop, "test_task")
+
+  def flaky_task(self, fail_times=0):
+    self.calls.append(fail_times)
+    if len(self.calls) <= fail_times:
+      raise RuntimeError("boom")
+
+  def test_idempotency_key_queues_once(self):
+    first = tasks.enqueue("test_task", key="once")
+    self.assertEqual(tasks.enqueue("test_task", key="once"), first)
+    self.assertEqual(tasks.run_pending(), 1)
+    self.assertEqual(Job.objects.get().status, Job.DONE)
+
+  def test_failed_jobs_are_retried_with_backoff(self):
+    job = tasks.enqueue("test_task", {"fail_times": 1}, max_attempts=2)
+    tasks.run_pending()
+    job.refresh_from_db()
+    self.assertEqual((job.status, job.attempts), (Job.PENDING, 1))
+    self.assertIn("RuntimeError", job.last_error)
+
+    Job.objects.update(run_at=now())
+    tasks.run_pending()
+    job.refresh_from_db()
+    self.assertEqual((job.status, job.attempts), (Job.DONE, 2))
+
+  @override_settings(TASKS_EAGER=True)
+  def test_eager_mode_runs_inline(self):
+    self.assertIsNone(tasks.enqueue("test_task"))
+    self.assertEqual(self.calls, [0])
+    self.assertFalse(Job.objects.exists())
+
+
+urlpatterns = [*async_urlpatterns, path("sync/", include(router.urls))]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncReadViewTests(ShopTestCase):
+  def setUp(self):
+    super().setUp()
+    self.token = Token.objects.create(user=self.user)
+    self.async_client = AsyncClient()
+    self.create_products(3)
+
+  def aget(self, path, token=None):
+    return self.async_client.get(path, headers={"Authorization": f"Token {token or self.token.key}"})
+
+  async def test_async_views_match_viewsets(self):
+    for path in ["products/", f"products/{await Product.objects.values_list('pk', flat=True).afirst()}/", "teams/", "categories/", "analytics/summary/", "analytics/top-products/", "analytics/dashboard/"]:
+      response = await self.aget(f"/api/{path}")
+      self.assertEqual(response.status_code, 200, path)
+      expected = await sync_to_async(self.client.get)(f"/sync/{path}")
+      self.assertEqual(json.loads(response.content), json.loads(expected.content), path)
+
+  async def test_async_views_require_a_token(self):
+    response = await self.async_client.get("/api/products/")
+    self.assertEqual(response.status_code, 401)
+    response = await self.aget("/api/products/", token="wrong")
+    self.assertEqual(json.loads(response.content), {"detail": "Invalid token."})
+
+  async def test_async_and_sync_authentication_fail_alike(self):
+    client = APIClient()
+    for header in ["Token", "Token a b", "Token wrong", "Basic abc"]:
+      response = await self.async_client.get("/api/products/", headers={"Authorization": header})
+      expected = await sync_to_async(client.get)("/sync/products/", headers={"Authorization": header})
+      self.assertEqual((response.status_code, json.loads(response.content)), (expected.status_code, expected.json()), header)
+
+  async def test_async_detail_not_found(self):
+    response = await self.aget("/api/products/999/")
+    self.assertEqual(response.status_code, 404)
@@ -1,6 +1,8 @@
 from rest_framework.routers import DefaultRouter
-from django.urls import path, include
-from .views import AnalyticsViewSet, PaymentViewSet, TeamViewSet, TeamMemberViewSet, CategoryViewSet, ProductViewSet, OrderViewSet
+from django.conf import settings
+from django.urls import path, include, re_path
+from . import async_views
+from .views import AnalyticsViewSet, ExportViewSet, PaymentViewSet, SyncViewSet, TeamViewSet, TeamMemberViewSet, CategoryViewSet, ProductViewSet, OrderViewSet
 
 router = DefaultRouter()
 router.register(r'teams', TeamViewSet)
@@ -10,7 +12,23 @@ router.register(r'products', ProductViewSet, basename='product')
 router.register(r'orders', OrderViewSet)
 router.register(r'payments', PaymentViewSet)
 router.register(r'analytics', AnalyticsViewSet, basename='analytics')
+router.register(r'exports', ExportViewSet, basename='export')
+router.register(r'sync', SyncViewSet, basename='sync')
+
+# Served before the router so they shadow the matching read-only viewset routes.
+# The event stream has no sync counterpart, it would hold a WSGI worker per client
+async_urlpatterns = [
+  path('api/teams/', async_views.TeamView.as_view()),
+  path('api/teams/<int:pk>/', async_views.TeamView.as_view()),
+  path('api/categories/', async_views.CategoryView.as_view()),
+  path('api/categories/<int:pk>/', async_views.CategoryView.as_view()),
+  path('api/products/', async_views.ProductView.as_view()),
+  path('api/products/<int:pk>/', async_views.ProductView.as_view()),
+  path('api/events/', async_views.EventStreamView.as_view()),
+  re_path(r'^api/analytics/(?P<action>top-products|top-users|summary|sales-over-time|dashboard)/$', async_views.AnalyticsView.as_view()),
+]
 
 urlpatterns = [
+  *(async_urlpatterns if settings.ASYNC_READ_VIEWS else []),
   path('api/', include(router.urls)),
-]
\ No newline at end of file
+]
@@ -1,18 +1,60 @@
 from rest_framework import viewsets, mixins
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
-from django.db.models import Sum, Count
-from django.db.models.functions import Coalesce
-from datetime import date, timedelta
-from django.db.models.functions import TruncDate
-from django.utils.timezone import now
-from .models import OrderItem, Team, TeamMember, Category, Product, Order, Payment
+from django.conf import settings
+from django.core.cache import cache
+from django.http import StreamingHttpResponse
+from django.db.models import Count
+from django.utils.dateparse import parse_date
+from datetime import timedelta
+from . import analytics, exports, ledger, representations, sync
+from .business_days import start_of_day
+from .cache import CachedResponseMixin
+from .idempotency import IdempotentCreateMixin
+from .models import Team, TeamMember, Category, Product, Order, Payment
+from .pagination import OrderCursorPagination, PaymentCursorPagination
+from .representations import ValuesListMixin
 from .serializers import (
   TeamSerializer, TeamMemberSerializer, CategorySerializer,
-  ProductSerializer, OrderSerializer, PaymentSerializer
+  ProductSerializer, OrderSerializer, PaymentSerializer, PaymentIdsSerializer
 )
 
-class TeamViewSet(viewsets.ReadOnlyModelViewSet):
+def date_param(request, name):
+  value = request.query_params.get(name)
+  if value is None:
+    return None
+  try:
+    parsed = parse_date(value)
+  except ValueError:
+    # Well formed, but no such day, e.g. 2025-02-30
+    parsed = None
+  if parsed is None:
+    raise ValidationError({name: "Use the YYYY-MM-DD format."})
+  return parsed
+
+
+def int_param(request, name):
+  value = request.query_params.get(name)
+  if value is None:
+    return None
+  # isdigit() alone also accepts digits such as "²" that int() rejects
+  if not (value.isascii() and value.isdigit()):
+    raise ValidationError({name: "Must be an integer id."})
+  return int(value)
+
+
+def bool_param(request, name):
+  value = request.query_params.get(name)
+  if value is None:
+    return None
+  if value.lower() not in ("true", "false", "1", "0"):
+    raise ValidationError({name: "Use true or false."})
+  return value.lower() in ("true", "1")
+
+
+class TeamViewSet(CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
   queryset = Team.objects.all()
   serializer_class = TeamSerializer
 
@@ -21,119 +63,154 @@ class TeamMemberViewSet(viewsets.ReadOnlyModelViewSet):
   serializer_class = TeamMemberSerializer
 
   def get_queryset(self):
-    return TeamMember.objects.annotate(order_count=Count("orders")).order_by("-order_count")
+    return TeamMember.objects.select_related("team").annotate(order_count=Count("orders")).order_by("-order_count")
 
 
-class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
+class CategoryViewSet(CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
   queryset = Category.objects.all()
   serializer_class = CategorySerializer
 
 
-class ProductViewSet(viewsets.ReadOnlyModelViewSet):
+class ProductViewSet(CachedResponseMixin, ValuesListMixin, viewsets.ReadOnlyModelViewSet):
   serializer_class = ProductSerializer
+  list_values = representations.PRODUCT_VALUES
+  list_representation = staticmethod(representations.products)
 
   def get_queryset(self):
-    queryset = Product.objects.annotate(
-        total_ordered=Coalesce(Sum("orderitem__quantity"), 0)
-      ).order_by("-total_ordered")
-    
+    queryset = Product.objects.select_related("category").order_by("-total_ordered", "id")
+
     category_id = self.request.query_params.get('category')
     if category_id is not None:
       queryset = queryset.filter(category_id=category_id)
     return queryset
 
 
-class OrderViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, 
+class OrderViewSet(IdempotentCreateMixin, ValuesListMixin, mixins.CreateModelMixin, mixins.ListModelMixin,
                    mixins.RetrieveModelMixin, viewsets.GenericViewSet):
-  queryset = Order.objects.all().select_related("by").prefetch_related("items__product")
+  idempotency_scope = "order"
+  queryset = Order.objects.all().select_related("by").prefetch_related("items__product__category")
   serializer_class = OrderSerializer
+  pagination_class = OrderCursorPagination
+  list_values = representations.ORDER_VALUES
+  list_representation = staticmethod(representations.orders)
+
+  def get_queryset(self):
+    queryset = super().get_queryset()
+    expand = self.request.query_params.get("expand")
+    if expand is not None and "product" not in expand.split(","):
+      queryset = queryset.prefetch_related(None).prefetch_related("items")
+
+    by = int_param(self.request, "by")
+    if by is not None:
+      queryset = queryset.filter(by_id=by)
+
+    # Compare against day boundaries instead of __date so the datetime index is used
+    start = date_param(self.request, "start")
+    if start is not None:
+      queryset = queryset.filter(datetime__gte=start_of_day(start))
+    end = date_param(self.request, "end")
+    if end is not None:
+      queryset = queryset.filter(datetime__lt=start_of_day(end + timedelta(days=1)))
+    return queryset
 
 
-class PaymentViewSet(mixins.CreateModelMixin, mixins.ListModelMixin,
+class PaymentViewSet(IdempotentCreateMixin, mixins.CreateModelMixin, mixins.ListModelMixin,
                      mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+  idempotency_scope = "payment"
   queryset = Payment.objects.all()
   serializer_class = PaymentSerializer
+  pagination_class = PaymentCursorPagination
+
+  def get_queryset(self):
+    queryset = super().get_queryset()
+
+    by = int_param(self.request, "by")
+    if by is not None:
+      queryset = queryset.filter(by_id=by)
+
+    completed = bool_param(self.request, "completed")
+    if completed is not None:
+      queryset = queryset.completed(completed)
+    return queryset
+
+  @action(detail=False, methods=["post"], permission_classes=[IsAdminUser])
+  def complete(self, request):
+    """Complete the payments with the posted ``ids`` in one transaction, staff only."""
+    serializer = PaymentIdsSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    ids = serializer.validated_data["ids"]
+    completed = ledger.complete_payments(ids)
+    return Response({"completed": completed, "skipped": sorted(set(ids) - set(completed))})
 
 
 class AnalyticsViewSet(viewsets.ViewSet):
+  """Dashboard figures, see shop.analytics."""
+
   @action(detail=False, methods=["get"], url_path='top-products')
   def top_products(self, request):
-    qs = (
-      OrderItem.objects
-      .values("product__name")
-      .annotate(total_sold=Sum("quantity"))
-      .order_by("-total_sold")[:5]
-    )
-    labels = [item["product__name"] for item in qs]
-    values = [item["total_sold"] for item in qs]
-    return Response({"labels": labels, "values": values})
+    return Response(analytics.top_products())
 
   @action(detail=False, methods=["get"], url_path='top-users')
   def top_users(self, request):
-    qs = (
-      Order.objects
-      .values("by__name")
-      .annotate(total_spent=Sum("total_amount"))
-      .order_by("-total_spent")[:5]
-    )
-    labels = [item["by__name"] for item in qs]
-    values = [item["total_spent"] for item in qs]
-    return Response({"labels": labels, "values": values})
+    return Response(analytics.top_users())
 
   @action(detail=False, methods=["get"])
   def summary(self, request):
-    user_id = request.query_params.get("user_id")
-
-    if user_id:
-      orders = Order.objects.filter(by_id=user_id)
-    else:
-      orders = Order.objects.all()
-    
-    total_spent = orders.aggregate(total=Sum("total_amount"))["total"] or 0
-    total_orders = orders.count()
-
-    avg_order_value = round(total_spent / total_orders, 2) if total_orders > 0 else 0.00
-
-    start_date = date(2025, 9, 23)
-    end_date = now().date()
-
-    if total_orders > 0 and end_date >= start_date:
-        total_days = sum(
-            1 for i in range((end_date - start_date).days + 1)
-            if (start_date + timedelta(days=i)).weekday() < 5
-        )
-        total_days = max(total_days, 1)
-        avg_orders_per_day = round(total_orders / total_days, 1)
-    else:
-        avg_orders_per_day = 0.0
-
-    return Response({
-      "total_spent": total_spent,
-      "total_orders": total_orders,
-      "avg_order_value": avg_order_value,
-      "avg_orders_per_day": avg_orders_per_day,
-    })
+    return Response(analytics.summary(request.query_params.get("user_id")))
   
   @action(detail=False, methods=["get"], url_path='sales-over-time')
   def sales_over_time(self, request):
+    return Response(analytics.sales_over_time(int(request.query_params.get("days", 30))))
+
+  @action(detail=False, methods=["get"])
+  def dashboard(self, request):
+    user_id = request.query_params.get("user_id")
     days = int(request.query_params.get("days", 30))
-    start_date = now().date() - timedelta(days=days)
-    end_date = now().date()
-
-    qs = (
-      OrderItem.objects
-      .filter(order__datetime__date__gte=start_date)
-      .annotate(date=TruncDate("order__datetime"))
-      .values("date")
-      .annotate(total=Sum("quantity"))
+    key = analytics.dashboard_cache_key(user_id, days)
+
+    data = cache.get(key)
+    if data is None:
+      data = analytics.dashboard(user_id, days)
+      cache.set(key, data, settings.DASHBOARD_CACHE_TIMEOUT)
+    return Response(data)
+
+
+class SyncViewSet(viewsets.ViewSet):
+  """Rows changed since ``?since=<token>``, see shop.sync."""
+
+  def list(self, request):
+    since = request.query_params.get("since")
+    if since is not None:
+      since = sync.parse_token(since)
+      if since is None:
+        raise ValidationError({"since": "Use the token returned by the previous sync."})
+    return Response(sync.changes(since, context={"request": request}))
+
+
+class ExportViewSet(viewsets.ViewSet):
+  """Streamed CSV or JSON lines exports for the accountants, see shop.exports."""
+
+  def stream(self, request, kind, start_date=None, end_date=None, **filters):
+    output = request.query_params.get("output", "csv")
+    if output not in exports.CONTENT_TYPES:
+      raise ValidationError({"output": f"Use one of {', '.join(exports.CONTENT_TYPES)}."})
+
+    response = StreamingHttpResponse(
+      exports.export(kind, output, team=int_param(request, "team"), **filters),
+      content_type=exports.CONTENT_TYPES[output],
     )
-    totals_by_date = {item["date"]: float(item["total"]) for item in qs}
+    response["Content-Disposition"] = f'attachment; filename="{exports.filename(kind, output, start_date, end_date)}"'
+    return response
 
-    labels, values = [], []
-    current = start_date
-    while current <= end_date:
-      labels.append(current.strftime("%d-%m"))
-      values.append(totals_by_date.get(current, 0.0))
-      current += timedelta(days=1)
+  @action(detail=False, methods=["get"])
+  def orders(self, request):
+    start, end = date_param(request, "start"), date_param(request, "end")
+    return self.stream(
+      request, "orders", start, end,
+      start=start_of_day(start) if start else None,
+      end=start_of_day(end + timedelta(days=1)) if end else None,
+    )
 
-    return Response({"labels": labels, "values": values})
+  @action(detail=False, methods=["get"])
+  def payments(self, request):
+    return self.stream(request, "payments", completed=bool_param(request, "completed"))